@@ -3,6 +3,11 @@ from app_util import *
 
 def main():
     print("Welcome to Portfolio Manager")
+    # keep the connections open for the whole run, every step shares them
+    with open_database():
+        run()
+
+def run():
     '''Load Transactions from CSV'''
     load_transactions()
 
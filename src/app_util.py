@@ -8,23 +8,25 @@ from const import *
 from const_private import *
 from datetime import datetime, timedelta
 
-def load_transactions():
-    clear_table()
+def load_transactions(incremental=True):
+    if not incremental:
+        clear_table()
     print(f"{title_line} Loading transactions... {title_line}")
-    pm = PortfolioManager()
-    for cat in TRANSACTIONS_CATS:
-        pm.load_transactions_from_folder(TRANSACTIONS_PATH + cat + "/")
-    pm.load_daily_cash_from_csv(CASH_PATH)
+    pm = PortfolioManager(replay=True)
+    pm.sync_transactions([TRANSACTIONS_PATH + cat + "/" for cat in TRANSACTIONS_CATS], CASH_PATH)
     pm.close()
 
 def view_database():
-    print(f"{title_line} Saving database to CSV... {title_line}")
+    print(f"{title_line} Exporting database... {title_line}")
     viewer = DatabaseViewer()
-    viewer.save_transactions_to_csv(f"{DBVIEWER_PATH}transactions.csv")
-    viewer.save_stock_data_to_csv(f"{DBVIEWER_PATH}stock_data.csv")
-    viewer.save_daily_cash_to_csv(f"{DBVIEWER_PATH}daily_cash.csv")
-    viewer.save_daily_prices_to_csv(f"{DBVIEWER_PATH}daily_prices.csv")
-    viewer.save_realized_gain_to_csv(f"{DBVIEWER_PATH}realized_gains.csv")
+    viewer.export_tables(DBVIEWER_PATH)
+    if DBVIEWER_PRETTY_ROWS:
+        # newest rows only, as pretty text tables
+        viewer.save_transactions_to_csv(f"{DBVIEWER_PATH}transactions.txt", DBVIEWER_PRETTY_ROWS)
+        viewer.save_stock_data_to_csv(f"{DBVIEWER_PATH}stock_data.txt", DBVIEWER_PRETTY_ROWS)
+        viewer.save_daily_cash_to_csv(f"{DBVIEWER_PATH}daily_cash.txt", DBVIEWER_PRETTY_ROWS)
+        viewer.save_daily_prices_to_csv(f"{DBVIEWER_PATH}daily_prices.txt", DBVIEWER_PRETTY_ROWS)
+        viewer.save_realized_gain_to_csv(f"{DBVIEWER_PATH}realized_gains.txt", DBVIEWER_PRETTY_ROWS)
     viewer.close()
 
 def clear_table():
@@ -39,6 +41,11 @@ def clear_table():
     portfolio.clear_table("daily_cash")
     # clear daily_prices table
     portfolio.clear_table("realized_gains")
+    # clear file_manifest table, next load is a full rebuild
+    portfolio.clear_table("file_manifest")
+    # clear daily_valuation table, it is rebuilt from the replayed stock_data
+    portfolio.clear_table("daily_valuation")
+    portfolio.close()
 
 def plot_line_chart():
     print(f"{title_line} Plotting line chart... {title_line}")
@@ -48,6 +55,7 @@ def plot_line_chart():
         pt.plot_line_chart_ends_at_today(file_name= f"{CHART_PATH}portfolio_line_chart_{date_unit}_{date_str}.png", 
                                         time_period=date_num, 
                                         time_str=date_str)
+    pt.close()
 
 def display_historical_portfolio_ror():
     print(f"{title_line} Displaying historical portfolio ror... {title_line}")
@@ -67,6 +75,7 @@ def plot_historical_line_chart():
                                         end_date=date_dt,
                                         time_period=date_num,
                                         time_str=date_str)  
+    pt.close()
     
 
 
@@ -85,6 +94,7 @@ def plot_ticker_line_chart():
                                     ticker=ticker,
                                     time_period=date_num,
                                     time_str=date_str)
+    pt.close()
 
 def display_portfolio_ror(yyyy_mm_dd, previous_range = 2):
     print(f"{title_line} Displaying portfolio ror... {title_line}")
@@ -124,6 +134,7 @@ def display_ticker_ror():
     print("{title_line} Displaying ticker ror... {title_line}")
     ror_plotter = TickerRORPlotter()
     ror_plotter.plot_all_tickers()
+    ror_plotter.close()
 
 def test():
     # PortfolioManager()
@@ -131,5 +142,7 @@ def test():
     pdu = PortfolioDisplayerUtil()
     pdu.clear_daily_prices(date="2024-12-16", before=False)
     dbv.save_daily_prices_to_csv("./test_daily_prices_1.csv")
+    dbv.close()
+    pdu.close()
     # pdu.fetch_and_store_price("NVDA", "2024-12-15")
     # dbv.save_daily_prices_to_csv("./test_daily_prices_2.csv")
\ No newline at end of file
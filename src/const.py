@@ -1,6 +1,7 @@
 # input data    
 TRANSACTIONS_PATH = "input_transactions/"
 CASH_PATH = f"{TRANSACTIONS_PATH}cash/cash.csv"
+CASH_TRANSFERS_PATH = f"{TRANSACTIONS_PATH}cash/transfers.csv" # optional deposits / withdrawals, cash is derived if present
 
 # output data
 OUTPUT_PATH = "results/"
@@ -10,6 +11,12 @@ ROR_SUMMARY_TABLE_PATH = f"{ROR_TABLE_PATH}ror_summary_table/"
 CHART_PATH = f"{OUTPUT_PATH}plot_line_chart/"
 DBVIEWER_PATH = f"{OUTPUT_PATH}dbviewer/"
 TICKER_CHART_PATH = f"{OUTPUT_PATH}plot_ticker_line_chart/"
+BENCHMARK_PATH = f"{OUTPUT_PATH}benchmark/"
+
+# database viewer
+DBVIEWER_FORMAT = "parquet" # "parquet" or "arrow" (Arrow IPC file), both need pyarrow
+DBVIEWER_CHUNK_ROWS = 50000 # rows fetched from the cursor and written per record batch
+DBVIEWER_PRETTY_ROWS = 0 # also write the newest N rows of each table as a pretty text table, 0 to skip
 
 # plotter
 NUM_OF_PLOT = 16
@@ -32,4 +39,55 @@ title_line = "=============================="
 
 # Debug mode
 DBUG = False
-DIYSWITCH = True
\ No newline at end of file
+DIYSWITCH = True
+
+# loader
+LOAD_WORKERS = None # None uses all cores
+
+CSV_STREAM_MIN_BYTES = 64 * 1024 * 1024 # files at least this large are parsed in chunks
+CSV_CHUNK_ROWS = 100000
+
+# cost basis
+COST_BASIS_METHOD = "average" # "average", "fifo" or "lifo"
+
+# validation
+VALIDATE_TRANSACTIONS = True # check every batch before it is written, errors abort the load
+VALIDATION_SEVERITY = { # "error" aborts the load, "warning" is reported and the replay handles the row as usual
+    "zero_cost": "warning", # airdrops, staking rewards, zero-cost transfers: skipped by the replay
+    "oversell": "warning", # sells more than held: logged by the replay, relieved at zero cost
+}
+
+# prices
+PREFETCH_BATCH_SIZE = 50 # tickers per download for providers with multi-ticker calls
+PRICE_PROVIDER = "yfinance" # "yfinance" or "local"
+YFINANCE_PER_TICKER = False # yfinance: one Ticker.history request per ticker instead of batched yf.download calls
+PRICE_FIXTURE_PATH = "price_fixtures/" # local provider: directory of <TICKER>.csv/.parquet or one date,ticker,close file
+PRICE_PROVIDER_LATENCY = 0 # local provider: seconds slept per call
+FETCH_CONCURRENCY = 8 # downloads in flight at once
+FETCH_RATE_LIMIT = 8 # downloads started per second
+FETCH_BURST = 8 # downloads that can start at once after an idle period
+FETCH_RETRIES = 3 # retries of a failed download
+FETCH_BACKOFF = 0.5 # seconds before the first retry, doubled on every retry
+LIVE_PRICE_TTL = 300 # seconds an unsettled (intraday) price is served before it is fetched again
+LIVE_PRICE_CACHE_SIZE = 1024 # unsettled prices kept in memory, least recently used are evicted
+PRICE_MISS_RETRY_AFTER = 24 * 3600 # seconds before a ticker / range without data is requested again
+CRYPTO_QUOTE_TTL = 60 # seconds a batched crypto quote is served before all crypto quotes are refreshed
+CRYPTO_EOD_CUTOFF_UTC = 0 # hour (UTC) on day D + 1 at which the crypto close of day D is final and stored
+
+# sqlite
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL", # readers do not block the writer
+    "synchronous": "NORMAL", # safe with WAL, fsync only at checkpoints
+    "cache_size": -64 * 1024, # KiB of page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+DB_READ_POOL_SIZE = 4 # idle read-only connections kept open for reuse
+DB_STATEMENT_CACHE_SIZE = 256 # prepared statements cached per connection
+POSITION_STORE_SUFFIX = "_positions" # portfolio.db keeps its memory-mapped position matrices in portfolio_positions/
+
+# market calendar
+CALENDAR_PATH = "calendar/" # precomputed trading day bitmaps
+CALENDAR_OVERRIDES = { # date: True if open, False if closed, applied on top of the exchange calendar
+    "2025-01-09": False, # National Day of Mourning for President Carter
+}
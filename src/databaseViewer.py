@@ -1,46 +1,155 @@
 from tabulate import tabulate  # 用于表格格式化显示
-import sqlite3
+import os
 import pandas as pd
+from portfolioDatabase import open_database
+from const import *
 
 class DatabaseViewer:
     def __init__(self, db_name="portfolio.db"):
-        # 初始化 SQLite 数据库连接
-        self.conn = sqlite3.connect(db_name)
+        # 初始化 SQLite 数据库连接, read-only connection from the shared pool
+        self.db = open_database(db_name)
+        self.conn = self.db.acquire_reader()
 
     def fetch_data(self, query):
         df = pd.read_sql_query(query, self.conn)
         return df
 
-    def save_tabulate_to_csv(self, query, keys, filename):
+    def save_tabulate_to_csv(self, query, keys, filename, rows=None):
+        """Write the query result as a pretty text table, only its first rows if rows is set."""
+        if rows:
+            query = f"{query} LIMIT {int(rows)}"
         df = self.fetch_data(query)
         table = tabulate(df, headers=keys, tablefmt='pretty')
         with open(filename, 'w') as f:
             f.write(table)
 
-    def save_transactions_to_csv(self, filename):
+    def save_transactions_to_csv(self, filename, rows=None):
         query = "SELECT * FROM transactions ORDER BY date DESC"
         keys = ["Date", "Ticker", "Source", "Cost", "Quantity"]
-        self.save_tabulate_to_csv(query, keys, filename)
+        self.save_tabulate_to_csv(query, keys, filename, rows)
 
-    def save_stock_data_to_csv(self, filename):
+    def save_stock_data_to_csv(self, filename, rows=None):
         query = "SELECT * FROM stock_data ORDER BY date DESC"
         keys = ["Date", "Ticker", "Cost Basis", "Total Quantity"]
-        self.save_tabulate_to_csv(query, keys, filename)    
+        self.save_tabulate_to_csv(query, keys, filename, rows)    
 
-    def save_daily_cash_to_csv(self, filename):
+    def save_daily_cash_to_csv(self, filename, rows=None):
         query = "SELECT * FROM daily_cash ORDER BY date DESC"
         keys = ["Date", "Cash Balance"]
-        self.save_tabulate_to_csv(query, keys, filename)
+        self.save_tabulate_to_csv(query, keys, filename, rows)
 
-    def save_daily_prices_to_csv(self, filename):
+    def save_daily_prices_to_csv(self, filename, rows=None):
         query = "SELECT * FROM daily_prices ORDER BY date DESC"
         keys = ["Date", "Ticker", "Price"]
-        self.save_tabulate_to_csv(query, keys, filename)
+        self.save_tabulate_to_csv(query, keys, filename, rows)
 
-    def save_realized_gain_to_csv(self, filename):
+    def save_realized_gain_to_csv(self, filename, rows=None):
         query = "SELECT * FROM realized_gains ORDER BY date DESC"
         keys = ["Date", "Ticker", "Gain"]
-        self.save_tabulate_to_csv(query, keys, filename)
+        self.save_tabulate_to_csv(query, keys, filename, rows)
+
+    EXPORT_TABLES = ["transactions", "stock_data", "daily_cash", "daily_prices", "realized_gains",
+                     "realized_lots", "daily_valuation"]
+    DATE_COLUMNS = ("date", "lot_date")
+
+    def export_schema(self, table):
+        """
+        Arrow schema of table from its declared column types: TEXT dates become date32,
+        REAL float64, INTEGER int64, other TEXT string.
+
+        Returns:
+        - (pa.Schema, list): schema and the primary key columns in key order
+        """
+        import pyarrow as pa
+        types = {"REAL": pa.float64(), "INTEGER": pa.int64()}
+        fields, key = [], []
+        for _, name, declared, _, _, pk in self.conn.execute(f"PRAGMA table_info({table})"):
+            if name in self.DATE_COLUMNS:
+                fields.append(pa.field(name, pa.date32()))
+            else:
+                fields.append(pa.field(name, types.get(declared.upper(), pa.string())))
+            if pk:
+                key.append((pk, name))
+        return pa.schema(fields), [name for _, name in sorted(key)]
+
+    def export_table(self, table, filename, format=DBVIEWER_FORMAT, chunk_rows=DBVIEWER_CHUNK_ROWS):
+        """
+        Stream table into a typed Parquet or Arrow IPC file, chunk_rows rows per record batch,
+        so the whole table is never held in memory.
+
+        Parameters:
+        - table: table name
+        - filename: output file, written to a temporary file and moved into place
+        - format: "parquet" or "arrow"
+
+        Returns:
+        - int: number of rows written, None if the file could not be written
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("Columnar export needs pyarrow installed (pip install pyarrow).")
+            return None
+        if format not in ("parquet", "arrow"):
+            print(f"Unknown export format {format}, expected parquet or arrow.")
+            return None
+
+        schema, key = self.export_schema(table)
+        order = f" ORDER BY {', '.join(key)}" if key else ""
+        cursor = self.conn.execute(f"SELECT {', '.join(schema.names)} FROM {table}{order}")
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        tmp_name = f"{filename}.tmp"
+        writer = None
+        written = 0
+        try:
+            writer = pq.ParquetWriter(tmp_name, schema) if format == "parquet" else pa.ipc.new_file(tmp_name, schema)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                columns = []
+                for field, values in zip(schema, zip(*rows)):
+                    if pa.types.is_date32(field.type):
+                        # keep "YYYY-MM-DD" of values stored with a time of day
+                        days = [value[:10] if value is not None else None for value in values]
+                        columns.append(pa.array(days, pa.string()).cast(pa.date32()))
+                    else:
+                        columns.append(pa.array(values, field.type))
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+                written += len(rows)
+            writer.close()
+        except Exception as e:
+            print(f"Error exporting {table} to {filename}: {e}")
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            return None
+        finally:
+            cursor.close()
+        os.replace(tmp_name, filename)
+        return written
+
+    def export_tables(self, path, format=DBVIEWER_FORMAT, chunk_rows=DBVIEWER_CHUNK_ROWS):
+        """
+        Export every table in EXPORT_TABLES to <path><table>.parquet (or .arrow).
+
+        Returns:
+        - dict: table: rows written
+        """
+        extension = "parquet" if format == "parquet" else "arrow"
+        exported = {}
+        for table in self.EXPORT_TABLES:
+            rows = self.export_table(table, f"{path}{table}.{extension}", format, chunk_rows)
+            if rows is None:
+                break
+            print(f"Exported {rows} rows of {table} to {path}{table}.{extension}")
+            exported[table] = rows
+        return exported
 
     def view_transactions(self):
         """按日期降序查看交易记录表的数据"""
@@ -83,4 +192,5 @@ class DatabaseViewer:
 
     def close(self):
         """关闭数据库连接"""
-        self.conn.close()
\ No newline at end of file
+        self.db.release_reader(self.conn)
+        self.db.release()
\ No newline at end of file
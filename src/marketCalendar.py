@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+from datetime import date as date_cls, timedelta
+import numpy as np
+from const import *
+
+EPOCH_ORDINAL = date_cls(1970, 1, 1).toordinal()
+
+class TradingCalendar:
+    """
+    Trading days of a market as a bitmap over every calendar day of a year range.
+
+    open[i] tells whether day start_day + i is a trading day, previous[i] / following[i]
+    hold the index of the last trading day on or before / first one on or after it
+    (-1 if there is none), so every lookup is O(1). The arrays are built once from
+    pandas_market_calendars, patched with CALENDAR_OVERRIDES and saved under
+    CALENDAR_PATH for the next process. Dates outside the range fall back to a
+    weekday rule (Monday to Friday, patched with the same overrides).
+    """
+    def __init__(self, market, start_year, end_year, is_open, overrides=None):
+        self.market = market
+        self.overrides = CALENDAR_OVERRIDES if overrides is None else overrides
+        self.start_year = start_year
+        self.end_year = end_year
+        self.start_day = date_cls(start_year, 1, 1).toordinal()
+        self.open = is_open.astype(bool)
+        index = np.arange(len(self.open))
+        self.previous = np.maximum.accumulate(np.where(self.open, index, -1))
+        following = np.where(self.open, index, len(self.open))
+        following = np.minimum.accumulate(following[::-1])[::-1]
+        self.following = np.where(following == len(self.open), -1, following)
+
+    @staticmethod
+    def overrides_key(overrides):
+        return hashlib.md5(json.dumps(overrides, sort_keys=True).encode()).hexdigest()[:8]
+
+    @classmethod
+    def build(cls, market, start_year, end_year, overrides=None):
+        import pandas_market_calendars as mcal
+
+        overrides = CALENDAR_OVERRIDES if overrides is None else overrides
+        start_day = date_cls(start_year, 1, 1).toordinal()
+        days = date_cls(end_year, 12, 31).toordinal() - start_day + 1
+        schedule = mcal.get_calendar(market).schedule(start_date=f"{start_year}-01-01", end_date=f"{end_year}-12-31")
+        is_open = np.zeros(days, dtype=bool)
+        is_open[[day.toordinal() - start_day for day in schedule.index.date]] = True
+        for day, value in overrides.items():
+            i = date_cls.fromisoformat(day).toordinal() - start_day
+            if 0 <= i < days:
+                is_open[i] = value
+        return cls(market, start_year, end_year, is_open, overrides)
+
+    @classmethod
+    def load(cls, market, start_year, end_year, overrides=None, path=CALENDAR_PATH):
+        """Load the bitmap saved for this year range and overrides, or build and save it."""
+        overrides = CALENDAR_OVERRIDES if overrides is None else overrides
+        file_path = os.path.join(path, f"{market}_{start_year}_{end_year}_{cls.overrides_key(overrides)}.npy")
+        if os.path.exists(file_path):
+            return cls(market, start_year, end_year, np.load(file_path), overrides)
+        calendar = cls.build(market, start_year, end_year, overrides)
+        os.makedirs(path, exist_ok=True)
+        np.save(file_path, calendar.open)
+        return calendar
+
+    def index(self, date):
+        """Index of a YYYY-MM-DD date in the bitmap, None if it is outside the year range."""
+        i = date_cls.fromisoformat(date[:10]).toordinal() - self.start_day
+        return i if 0 <= i < len(self.open) else None
+
+    def date(self, i):
+        return date_cls.fromordinal(self.start_day + int(i)).isoformat()
+
+    def __contains__(self, date):
+        return self.index(date) is not None
+
+    def weekday_open(self, date):
+        """Fallback for dates outside the range: open Monday to Friday unless overridden."""
+        return self.overrides.get(date[:10], date_cls.fromisoformat(date[:10]).weekday() < 5)
+
+    def is_open(self, date):
+        i = self.index(date)
+        return bool(self.open[i]) if i is not None else self.weekday_open(date)
+
+    def closest_open(self, date, step):
+        """
+        Closest trading day on or after (step 1) / before (step -1) date.
+        Inside the range the index arrays answer, outside it (or past the edge
+        of a range without one) the walk goes on day by day with the weekday rule.
+        """
+        day = date_cls.fromisoformat(date[:10])
+        while True:
+            i = day.toordinal() - self.start_day
+            if 0 <= i < len(self.open):
+                i = (self.following if step > 0 else self.previous)[i]
+                if i >= 0:
+                    return self.date(i)
+                day = date_cls.fromordinal(self.start_day + (len(self.open) if step > 0 else -1))
+                continue
+            if self.weekday_open(day.isoformat()):
+                return day.isoformat()
+            day += timedelta(days=step)
+
+    def previous_open(self, date):
+        """Last trading day on or before date."""
+        return self.closest_open(date, -1)
+
+    def previous_open_many(self, dates):
+        """Vectorized previous_open, "" where there is none in the range."""
+        days = np.array(dates, dtype='datetime64[D]').astype(np.int64) + EPOCH_ORDINAL - self.start_day
+        inside = (days >= 0) & (days < len(self.open))
+        previous = np.where(inside, self.previous[np.clip(days, 0, len(self.open) - 1)], -1)
+        result = (np.datetime64(date_cls.fromordinal(self.start_day).isoformat(), 'D') + previous).astype(str)
+        return np.where(previous >= 0, result, "")
+
+    def next_open(self, date):
+        """First trading day on or after date."""
+        return self.closest_open(date, 1)
+
+
+_calendars = {}
+
+def get_trading_calendar(market="NYSE", date=None):
+    """
+    Shared calendar of market covering date (today by default).
+    The range grows by whole years and always runs until next year.
+    """
+    year = int(date[:4]) if date else date_cls.today().year
+    calendar = _calendars.get(market)
+    if calendar is None or not calendar.start_year <= year <= calendar.end_year:
+        start_year = min(year, calendar.start_year if calendar else year, date_cls.today().year - 5)
+        end_year = max(year, calendar.end_year if calendar else year, date_cls.today().year + 1)
+        calendar = _calendars[market] = TradingCalendar.load(market, start_year, end_year)
+    return calendar
@@ -0,0 +1,331 @@
+#!/usr/local/bin/python3
+"""
+Ingestion / snapshot / chart benchmark on a synthetic portfolio.
+
+Generates a transaction tree in the input_transactions layout
+(exchange/source.csv, stock_split.csv, cash/cash.csv) plus synthetic daily prices
+up to the last settled day, then times load_transactions, snapshot generation and
+chart rendering and appends the results to a JSON file so regressions show up
+across versions. Prices come from an offline provider over the synthetic closes,
+a run that downloads anything fails instead of recording network timings.
+
+Usage:
+    ./portfolioBenchmark.py --tickers 30 --years 3 --trades-per-week 3
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import matplotlib
+matplotlib.use("Agg")
+
+SRC_PATH = os.path.dirname(os.path.abspath(__file__))
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
+
+from const import *
+from priceProvider import LocalPriceProvider, set_price_provider
+
+
+class SQLCounter:
+    """
+    Count every SQL statement run on connections opened while installed.
+    Connections opened before (e.g. held by a shared ConnectionManager) are not
+    counted, see reset_caches().
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        self.count += 1
+
+    @contextlib.contextmanager
+    def install(self):
+        connect = sqlite3.connect
+
+        def traced_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            conn.set_trace_callback(self)
+            return conn
+
+        sqlite3.connect = traced_connect
+        try:
+            yield self
+        finally:
+            sqlite3.connect = connect
+
+
+class SyntheticPortfolio:
+    """
+    Random but reproducible transaction tree.
+
+    Every ticker trades at every source, roughly trades_per_week times a week,
+    mostly DCA buys with some sells (never more than held) and dividends.
+    A quarter of the tickers get a 1:2 split in the middle of the range.
+    The range ends on the last settled day by default, so valuing the book up to
+    today needs no price that was not generated.
+    """
+    def __init__(self, tickers=20, years=2, trades_per_week=2, exchanges=2, seed=0, end_date=None):
+        from priceService import today_est
+        from priceCache import shift_date
+
+        self.tickers = [f"SYN{i:03d}" for i in range(tickers)]
+        self.exchanges = [f"exchange{i}" for i in range(exchanges)]
+        self.trades_per_week = trades_per_week
+        self.random = random.Random(seed)
+        self.end_date = end_date or datetime.strptime(shift_date(today_est(), -1), "%Y-%m-%d")
+        self.start_date = self.end_date - timedelta(days=int(365 * years))
+        self.days = [(self.start_date + timedelta(days=i)).strftime("%Y-%m-%d")
+                     for i in range((self.end_date - self.start_date).days + 1)]
+        self.splits = {ticker: self.days[len(self.days) // 2] for ticker in self.tickers[::4]}
+        self.prices = {ticker: self.random_walk(ticker) for ticker in self.tickers}
+
+    def random_walk(self, ticker):
+        price = self.random.uniform(10, 500)
+        prices = []
+        for day in self.days:
+            if self.splits.get(ticker) == day:
+                price /= 2
+            price *= 1 + self.random.gauss(0.0003, 0.02)
+            prices.append(round(price, 4))
+        return prices
+
+    def write(self, root=TRANSACTIONS_PATH):
+        """Write the tree under root, returns the number of transaction rows."""
+        rows = 0
+        probability = self.trades_per_week / 7
+        for exchange in self.exchanges:
+            os.makedirs(os.path.join(root, exchange), exist_ok=True)
+            for ticker in self.tickers:
+                held = 0.0
+                # one source per exchange, same-named files would be merged into one source
+                with open(os.path.join(root, exchange, f"{ticker}_{exchange}.csv"), "w") as f:
+                    for day, price in zip(self.days, self.prices[ticker]):
+                        if self.splits.get(ticker) == day:
+                            held *= 2
+                        if self.random.random() >= probability:
+                            continue
+                        kind = self.random.random()
+                        if kind < 0.8 or held == 0:
+                            quantity = round(self.random.uniform(0.1, 5), 6)
+                            f.write(f"{day},{ticker},{round(quantity * price, 2)},{quantity}\n")
+                            held += quantity
+                        elif kind < 0.95:
+                            quantity = round(held * self.random.uniform(0.05, 0.5), 6)
+                            f.write(f"{day},{ticker},{-round(quantity * price, 2)},{-quantity}\n")
+                            held -= quantity
+                        else:
+                            f.write(f"{day},{ticker},{-round(held * price * 0.005, 2)},0\n")
+                        rows += 1
+
+        with open(os.path.join(root, "stock_split.csv"), "w") as f:
+            for ticker, day in self.splits.items():
+                f.write(f"{day},{ticker},1,2\n")
+
+        os.makedirs(os.path.join(root, "cash"), exist_ok=True)
+        with open(os.path.join(root, "cash", "cash.csv"), "w") as f:
+            for day in self.days[::30]:
+                f.write(f"{day},cash,{round(self.random.uniform(1000, 50000), 2)},1\n")
+        return rows
+
+    def write_fixtures(self, path=PRICE_FIXTURE_PATH):
+        """Write <TICKER>.csv price fixtures (date, close) for LocalPriceProvider."""
+        os.makedirs(path, exist_ok=True)
+        for ticker in self.tickers:
+            with open(os.path.join(path, f"{ticker}.csv"), "w") as f:
+                f.write("date,close\n")
+                for day, price in zip(self.days, self.prices[ticker]):
+                    f.write(f"{day},{price}\n")
+
+    def store_prices(self, db_name="portfolio.db"):
+        """Store a close and its coverage for every ticker and day, so snapshots and charts start warm."""
+        from portfolioSchema import bump_versions, connect
+        from priceCache import PriceCoverage
+
+        conn = connect(db_name)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
+                             [(day, ticker, price) for ticker in self.tickers
+                              for day, price in zip(self.days, self.prices[ticker])])
+            bump_versions(conn, "daily_prices")
+        coverage = PriceCoverage(conn)
+        for ticker in self.tickers:
+            coverage.add(ticker, self.days[0], self.days[-1])
+        conn.close()
+
+
+class CountingProvider(LocalPriceProvider):
+    """LocalPriceProvider over the synthetic fixtures that counts its downloads."""
+    name = "benchmark"
+
+    def __init__(self, path=PRICE_FIXTURE_PATH):
+        super().__init__(path, latency=0)
+        self.downloads = 0
+
+    def download(self, tickers, start_date, end_date):
+        self.downloads += 1
+        return super().download(tickers, start_date, end_date)
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of finished children (e.g. parser workers) in MB."""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1))
+
+
+def reset_caches():
+    """
+    Drop the caches that outlive a phase: shared price services, position stores and
+    compiled split indexes. Every phase then starts cold, opens its own traced
+    connections and its SQL count is comparable across runs.
+    """
+    import portfolioDatabase
+    import portfolioPositions
+    import priceService
+    from portfolioSplits import SplitIndex
+
+    if portfolioDatabase._managers:
+        print(f"Warning: {len(portfolioDatabase._managers)} databases still open, their SQL is not counted")
+    priceService._services.clear()
+    portfolioPositions._stores.clear()
+    SplitIndex._cache.clear()
+
+
+def timed(results, phase, rows=None):
+    @contextlib.contextmanager
+    def measure():
+        reset_caches()
+        counter = SQLCounter()
+        start = time.perf_counter()
+        with counter.install():
+            yield
+        elapsed = time.perf_counter() - start
+        rss, children_rss = peak_rss_mb()
+        results[phase] = {
+            "seconds": round(elapsed, 4),
+            "sql_statements": counter.count,
+            "peak_rss_mb": rss,
+            "peak_children_rss_mb": children_rss,
+        }
+        if rows is not None:
+            results[phase]["rows"] = rows
+            results[phase]["rows_per_sec"] = round(rows / max(elapsed, 1e-9), 1)
+        print(f"{phase}: {results[phase]}")
+    return measure()
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=SRC_PATH,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    from portfolioManager import PortfolioManager
+    from portfolioDisplayer import Displayer
+    from portfolioPlotter import Plotter
+    from priceService import get_price_service
+
+    output = os.path.abspath(args.output)
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    # start from a clean tree, the workdir only holds what this script generated
+    if os.path.exists("portfolio.db"):
+        os.remove("portfolio.db")
+    shutil.rmtree(TRANSACTIONS_PATH, ignore_errors=True)
+    shutil.rmtree(PRICE_FIXTURE_PATH, ignore_errors=True)
+
+    portfolio = SyntheticPortfolio(tickers=args.tickers, years=args.years, trades_per_week=args.trades_per_week,
+                                   exchanges=args.exchanges, seed=args.seed)
+    rows = portfolio.write()
+    portfolio.write_fixtures()
+    portfolio.store_prices()
+    provider = CountingProvider()
+    set_price_provider(provider)
+    print(f"Generated {rows} transactions for {args.tickers} tickers over {args.years} years in {args.workdir}")
+
+    results = {}
+    folders = [os.path.join(TRANSACTIONS_PATH, exchange) + "/" for exchange in portfolio.exchanges]
+    with timed(results, "load_transactions", rows):
+        pm = PortfolioManager(replay=True)
+        pm.sync_transactions(folders, CASH_PATH)
+        pm.close()
+
+    end_date = portfolio.end_date
+    snapshot_dates = [(end_date - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(args.snapshots)]
+    with timed(results, "snapshots", len(snapshot_dates)):
+        displayer = Displayer()
+        for date in snapshot_dates:
+            displayer.calculate_rate_of_return_v2(date)
+        # the service lives as long as the database is open
+        price_stats = get_price_service(displayer.conn).stats()
+        displayer.close()
+
+    if not args.skip_charts:
+        os.makedirs(CHART_PATH, exist_ok=True)
+        windows = [window for window in ("1M", "3M", "1Y") if window in DATES]
+        with timed(results, "charts", len(windows)):
+            plotter = Plotter()
+            for window in windows:
+                date_num, date_unit = DATES[window]
+                plotter.plot_line_chart(file_name=f"{CHART_PATH}benchmark_{date_unit}_{window}.png",
+                                        end_date=end_date, time_period=date_num, time_str=window)
+            price_stats = get_price_service(plotter.conn).stats()
+            plotter.close()
+
+    if provider.downloads:
+        # a download means a price the synthetic data does not cover, the timings include it
+        print(f"Error: {provider.downloads} price downloads during the benchmark, results not recorded.")
+        sys.exit(1)
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": git_version(),
+        "python": sys.version.split()[0],
+        "params": vars(args),
+        "transactions": rows,
+        "results": results,
+        "price_service": price_stats,
+    }
+    history = []
+    if os.path.exists(output):
+        with open(output) as f:
+            history = json.load(f)
+    history.append(record)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(history, f, indent=2)
+    print(f"Benchmark results appended to {output}")
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PortfolioManager on a synthetic portfolio")
+    parser.add_argument("--tickers", type=int, default=20)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--trades-per-week", type=float, default=2)
+    parser.add_argument("--exchanges", type=int, default=2)
+    parser.add_argument("--snapshots", type=int, default=3, help="number of snapshot dates to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-charts", action="store_true")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "iportfolio_benchmark"),
+                        help="where the synthetic tree and db are written")
+    parser.add_argument("--output", default=f"{BENCHMARK_PATH}benchmark.json")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
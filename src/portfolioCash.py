@@ -0,0 +1,93 @@
+import csv
+import os
+from datetime import date as date_cls
+import numpy as np
+
+def day_number(date):
+    """YYYY-MM-DD (or a longer timestamp string) -> proleptic ordinal day number."""
+    return date_cls.fromisoformat(date[:10]).toordinal()
+
+class CashLedger:
+    """
+    Daily cash balances as one float64 array indexed by day number.
+
+    balances[i] is the balance at the end of day start_day + i, so a lookup is
+    O(1). Days before the first entry have a balance of 0 and days after the
+    last one keep the last balance.
+    """
+    def __init__(self, start_day=0, balances=None):
+        self.start_day = start_day
+        self.balances = np.zeros(0, dtype=np.float64) if balances is None else balances
+
+    @classmethod
+    def from_changes(cls, changes):
+        """
+        Build the ledger as a prefix sum of signed cash movements.
+
+        Parameters:
+        - changes (list): (date, amount) tuples, amount > 0 adds cash
+        """
+        if not changes:
+            return cls()
+        days = np.array([day_number(date) for date, _ in changes], dtype=np.int64)
+        amounts = np.array([amount for _, amount in changes], dtype=np.float64)
+        start_day = int(days.min())
+        daily = np.bincount(days - start_day, weights=amounts)
+        return cls(start_day, np.cumsum(daily))
+
+    @classmethod
+    def from_balances(cls, balances):
+        """
+        Build the ledger from point balances, forward filled between dates.
+
+        Parameters:
+        - balances (list): (date, balance) tuples
+        """
+        if not balances:
+            return cls()
+        days = np.array([day_number(date) for date, _ in balances], dtype=np.int64)
+        values = np.array([balance for _, balance in balances], dtype=np.float64)
+        order = np.argsort(days, kind='stable')
+        days, values = days[order], values[order]
+        start_day = int(days[0])
+        # index of the latest balance on or before each day
+        latest = np.searchsorted(days, np.arange(start_day, days[-1] + 1), side='right') - 1
+        return cls(start_day, values[latest])
+
+    @classmethod
+    def from_db(cls, conn):
+        return cls.from_balances(conn.execute("SELECT date, cash_balance FROM daily_cash").fetchall())
+
+    def get(self, date):
+        if not len(self.balances):
+            return 0
+        i = day_number(date) - self.start_day
+        if i < 0:
+            return 0
+        return float(self.balances[min(i, len(self.balances) - 1)])
+
+    def get_many(self, dates):
+        """Vectorized get for a list of dates."""
+        if not len(self.balances):
+            return np.zeros(len(dates))
+        i = np.array([day_number(date) for date in dates], dtype=np.int64) - self.start_day
+        values = self.balances[np.clip(i, 0, len(self.balances) - 1)]
+        return np.where(i < 0, 0.0, values)
+
+    def change_rows(self):
+        """(date, balance) rows for the days the balance changes, i.e. the compact daily_cash form."""
+        if not len(self.balances):
+            return []
+        changed = np.flatnonzero(np.diff(self.balances, prepend=np.nan) != 0)
+        return [(date_cls.fromordinal(self.start_day + int(i)).isoformat(), float(self.balances[i])) for i in changed]
+
+    @staticmethod
+    def read_transfers(file_path):
+        """
+        Read deposits and withdrawals, formatted like cash.csv:
+        yyyy-mm-dd, cash, amount, 1 (amount > 0 deposit, amount < 0 withdrawal)
+        """
+        if not os.path.exists(file_path):
+            return []
+        with open(file_path, newline='') as csvfile:
+            return [(date, float(amount)) for date, _, amount, _ in csv.reader(csvfile)]
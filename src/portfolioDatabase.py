@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+from portfolioSchema import apply_pragmas, connect
+from const import *
+
+class ConnectionManager:
+    """
+    Connections to one database file: a single writer shared by every object and a pool
+    of read-only connections.
+
+    WAL lets the readers run next to the writer without waiting on its transactions.
+    Every connection keeps DB_STATEMENT_CACHE_SIZE prepared statements, so the per-ticker
+    queries are compiled once per connection instead of once per object.
+
+    Managers are shared per file through open_database(); each owner calls release()
+    (or uses the manager as a context manager) and the connections are closed when the
+    last owner is gone.
+
+    Objects that read and write through the database for everyone (the PriceService)
+    are created once per manager with shared() and bound to the writer.
+    """
+    def __init__(self, db_name="portfolio.db", pool_size=DB_READ_POOL_SIZE, cached_statements=DB_STATEMENT_CACHE_SIZE):
+        self.db_name = db_name
+        self.path = os.path.abspath(db_name)
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.refs = 0
+        self._writer = None
+        self._idle = []
+        self._borrowed = set()
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    @property
+    def writer(self):
+        """The shared read-write connection, migrated to the current schema when first opened."""
+        if self._writer is None:
+            self._writer = connect(self.path, cached_statements=self.cached_statements)
+        return self._writer
+
+    def acquire_reader(self):
+        """
+        Borrow a read-only connection, give it back with release_reader().
+        A new one is opened when every pooled reader is in use.
+        """
+        # the writer creates the file and switches it to WAL before any reader opens it
+        self.writer
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True,
+                                       cached_statements=self.cached_statements, check_same_thread=False)
+                apply_pragmas(conn, {name: value for name, value in SQLITE_PRAGMAS.items() if name != "journal_mode"})
+            self._borrowed.add(conn)
+        return conn
+
+    def release_reader(self, conn):
+        """Return a reader to the pool, it is closed if the pool is already full."""
+        with self._lock:
+            self._borrowed.discard(conn)
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def owns(self, conn):
+        """True if conn is this manager's writer or one of its readers."""
+        return conn is self._writer or conn in self._borrowed or any(conn is idle for idle in self._idle)
+
+    def shared(self, name, factory):
+        """
+        Object created once per manager by factory(writer) and kept until the
+        connections are closed.
+        """
+        with self._lock:
+            obj = self._shared.get(name)
+        if obj is None:
+            obj = factory(self.writer)
+            with self._lock:
+                obj = self._shared.setdefault(name, obj)
+        return obj
+
+    @contextmanager
+    def reader(self):
+        conn = self.acquire_reader()
+        try:
+            yield conn
+        finally:
+            self.release_reader(conn)
+
+    def release(self):
+        """Drop one owner, the connections are closed with the last one."""
+        with _managers_lock:
+            if self.refs == 0:
+                return
+            self.refs -= 1
+            if self.refs:
+                return
+            if _managers.get(self.path) is self:
+                del _managers[self.path]
+        self.close()
+
+    def close(self):
+        with self._lock:
+            readers = self._idle + list(self._borrowed)
+            self._idle, self._borrowed = [], set()
+            self._shared = {}
+        for conn in readers:
+            conn.close()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def stats(self):
+        return {"owners": self.refs, "idle_readers": len(self._idle), "borrowed_readers": len(self._borrowed)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def open_database(db_name="portfolio.db"):
+    """
+    Connection manager of db_name, shared by everyone who has it open.
+    The caller owns one reference and must release() it.
+    """
+    path = os.path.abspath(db_name)
+    with _managers_lock:
+        manager = _managers.get(path)
+        if manager is None:
+            manager = _managers[path] = ConnectionManager(db_name)
+        manager.refs += 1
+    return manager
+
+def manager_of(conn):
+    """ConnectionManager that opened conn (its writer or a pooled reader), None for any other connection."""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        if manager.owns(conn):
+            return manager
+    return None
@@ -1,15 +1,9 @@
-import sqlite3
 import pandas as pd
 import matplotlib.pyplot as plt
-import yfinance as yf
 from datetime import datetime, timedelta
 from portfolioDisplayer_util import PortfolioDisplayerUtil, Util
 
 class Displayer(PortfolioDisplayerUtil):
-    def __init__(self, db_name="portfolio.db", debug=False):
-        self.conn = sqlite3.connect(db_name)
-        self.debug = debug
-
     def calculate_annualized_return(self, start_date, end_date, value, cost):
         duration_years = max((datetime.strptime(end_date, "%Y-%m-%d") \
                             - datetime.strptime(start_date, "%Y-%m-%d")).days / 365.25, 1)  # 不足一年按一年算
@@ -222,10 +216,24 @@ class Displayer(PortfolioDisplayerUtil):
         ror_data = []
         total_cost, total_value, total_unrealized_gain, total_realized_gain, total_profit = 0, 0, 0, 0, 0
 
+        # cash rewritten since the last snapshot is picked up here, once per snapshot
+        self.refresh_cash_ledger()
+
+        # every ticker's position on date in one row of the position store, no SQL per ticker
+        positions = self.positions
+        row = positions.at(date)
+        def position(field, ticker):
+            i = positions.ticker_ids.get(ticker)
+            return float(row[field][i]) if row is not None and i is not None else 0
+
+        # fetch all missing prices of the held tickers in one batched download
+        Util.prefetch_prices(self.conn, [(ticker, date) for ticker in tickers
+                                         if position("quantity", ticker) != 0])
+
         for ticker in tickers:
-            quantity_ticker = self.get_stock_quantity(ticker=ticker, date=date)
+            quantity_ticker = position("quantity", ticker)
             if quantity_ticker == 0:
-                realized_gain = self.get_realized_gain(ticker, date=date)
+                realized_gain = position("realized_gain", ticker)
                 ror_data.append({
                     "Ticker": ticker,
                     "Latest Price": None,
@@ -247,7 +255,30 @@ class Displayer(PortfolioDisplayerUtil):
                 continue
 
             todays_price = Util.fetch_and_store_price(db_conn=self.conn, ticker=ticker, date=date)
-            cost_basis = self.get_cost_basis(ticker=ticker, date=date)
+            cost_basis = position("cost_basis", ticker)
+            if todays_price is None:
+                # missing price (e.g. delisted): show the holding, leave it out of the totals
+                print(f"Missing price for {ticker} on {date}, left out of the totals")
+                realized_gain = position("realized_gain", ticker)
+                ror_data.append({
+                    "Ticker": ticker,
+                    "Latest Price": None,
+                    "Ave Cost Basis": round(cost_basis, 2),
+                    "Total Holding": round(quantity_ticker, 2),
+                    "Total Value": None,
+                    "Total Cost": round(cost_basis * quantity_ticker, 2),
+                    "Unrealized Gain": None,
+                    "Realized Gain": round(realized_gain, 2),
+                    "Total Profit": None,
+                    "Rate of Return (%)": None,
+                    "Portfolio (%)": None,
+                    "First Date": None,
+                    "Last Date": None,
+                    "Annualized RoR (%)": None
+                })
+                total_realized_gain += realized_gain
+                total_profit += realized_gain
+                continue
             total_value_ticker = quantity_ticker * todays_price
             total_cost_ticker = cost_basis * quantity_ticker
 
@@ -256,7 +287,7 @@ class Displayer(PortfolioDisplayerUtil):
                 continue
 
             unrealized_gain = total_value_ticker - total_cost_ticker
-            realized_gain = self.get_realized_gain(ticker, date=date)
+            realized_gain = position("realized_gain", ticker)
 
             profit = unrealized_gain + realized_gain
             rate_of_return = ((total_value_ticker / total_cost_ticker) - 1) * 100 if total_cost_ticker > 0 else None
@@ -300,7 +331,8 @@ class Displayer(PortfolioDisplayerUtil):
 
         # 添加 Portfolio (%) 列
         for row in ror_data:
-            row["Portfolio (%)"] = round((row["Total Value"] / (total_value + latest_cash)) * 100, 2) if total_value > 0 else 0
+            if row["Total Value"] is not None:
+                row["Portfolio (%)"] = round((row["Total Value"] / (total_value + latest_cash)) * 100, 2) if total_value > 0 else 0
 
         # 添加 Cash 行
         ror_data.append({
@@ -422,4 +454,4 @@ class Displayer(PortfolioDisplayerUtil):
         plt.close(fig)
 
     def close(self):
-        self.conn.close()
+        self.db.release()
@@ -1,42 +1,83 @@
-import sqlite3
-import pandas as pd
-import yfinance as yf
-from datetime import datetime, timedelta
-import pandas_market_calendars as mcal
+from datetime import datetime
+from portfolioSplits import SplitIndex
+from portfolioCash import CashLedger
+from portfolioDatabase import open_database
+from portfolioPositions import get_position_store
+from portfolioSchema import table_versions
+from priceService import get_price_service
+from marketCalendar import get_trading_calendar
 from const_private import *
 from const import *
 import pytz
 
-TEMP_PRICE_MAP = {} # DATE: {TICKER: PRICE}
-
 class PortfolioDisplayerUtil:
     def __init__(self, db_name="portfolio.db", debug=False):
-        self.conn = sqlite3.connect(db_name)
+        self.db = open_database(db_name)
+        # snapshots store prefetched closes and book totals, so they read on the writer too
+        self.conn = self.db.writer
         self.debug = debug
 
     def log(self, message):
         if self.debug:
             print(message)
 
+    def refresh_cash_ledger(self):
+        """
+        Read daily_cash again if a writer bumped its version since the ledger was built.
+        Called once per snapshot or chart batch, get_cash itself never queries.
+        """
+        version = table_versions(self.conn, "daily_cash")
+        if getattr(self, "_cash_ledger_version", None) != version:
+            self._cash_ledger = CashLedger.from_db(self.conn)
+            self._cash_ledger_version = version
+        return self._cash_ledger
+
+    @property
+    def cash_ledger(self):
+        if getattr(self, "_cash_ledger", None) is None:
+            return self.refresh_cash_ledger()
+        return self._cash_ledger
+
     def get_cash(self, date):
-        query = "SELECT cash_balance FROM daily_cash WHERE date <= ? ORDER BY date DESC LIMIT 1"
-        result = self.conn.execute(query, (date, )).fetchone()
-        return result[0] if result else 0
+        return self.cash_ledger.get(date)
     
-    def get_stock_quantity(self, ticker, date):
-        query = "SELECT total_quantity FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1"
+    @property
+    def positions(self):
+        """Forward-filled quantity, cost basis, close and realized gain matrices, see PositionStore."""
+        return get_position_store(self.conn)
+
+    @property
+    def split_index(self):
+        return SplitIndex.load(f'{TRANSACTIONS_PATH}stock_split.csv')
+
+    def get_stock_quantity(self, ticker, date, as_of=None):
+        """
+        Quantity held on date, carried through any split after the last stock_data row.
+        If as_of is given, the quantity is expressed in shares as of that date.
+        """
+        query = "SELECT total_quantity, date FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1"
         result = self.conn.execute(query, (ticker, date)).fetchone()
-        return result[0] if result else 0
+        if not result:
+            return 0
+        quantity, row_date = result
+        return self.split_index.normalize_quantity(ticker, row_date, quantity, as_of or date)
     
     def get_all_tickers(self):
         query = "SELECT DISTINCT ticker FROM stock_data"
         result = self.conn.execute(query).fetchall()
         return [row[0] for row in result]
 
-    def get_cost_basis(self, ticker, date):
-        query = "SELECT cost_basis FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1"
+    def get_cost_basis(self, ticker, date, as_of=None):
+        """
+        Cost basis per share on date, carried through any split after the last stock_data row.
+        If as_of is given, the cost basis is expressed per share as of that date.
+        """
+        query = "SELECT cost_basis, date FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1"
         result = self.conn.execute(query, (ticker, date)).fetchone()
-        return result[0] if result else 0
+        if not result:
+            return 0
+        cost_basis, row_date = result
+        return self.split_index.normalize_price(ticker, row_date, cost_basis, as_of or date)
     
     def get_ticker_date_range(self, ticker):
         date_range = self.conn.execute("""
@@ -81,53 +122,7 @@ class PortfolioDisplayerUtil:
         """
         从 Yahoo Finance 获取指定日期的股票价格，并存储到 daily_prices 表。
         """
-        # Check if the ticker and date already exist in the daily_prices table
-        query = "SELECT price FROM daily_prices WHERE ticker = ? AND date = ?"
-
-        # if ticker is crypto and date is in TEMP_PRICE_MAP, return the price
-        if ticker in CRYPTO_TICKERS and date in TEMP_PRICE_MAP:
-            if ticker in TEMP_PRICE_MAP[date]:
-                return TEMP_PRICE_MAP[date][ticker]
-
-        # if ticker is not crypto, check the db
-        result = self.conn.execute(query, (ticker, date)).fetchone()
-        if result:
-            return result[0]
-        
-        # fetch the price from Yahoo Finance
-        try:
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-            end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-
-
-            self.log(f"Fetching price for {ticker} on {date}...")
-            history = yf.download(ticker, start_date, end_date)
-            if not history.empty:
-                # Get the last valid price and date
-                price_series = history['Close']
-                last_valid_price = list(round(price_series.iloc[-1], 8))[0]
-                last_valid_date = price_series.index[-1].strftime("%Y-%m-%d")
-
-                # if market is close and ticker is not crypto, save the date, price to db
-                is_market_open = Util.is_market_open(date)
-                if is_market_open == False and ticker not in CRYPTO_TICKERS:
-                    self.log(f"Market is closed on {date}, saving the last valid price {last_valid_price} on {date}")
-                    with self.conn:
-                        self.conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                        (date, ticker, last_valid_price))
-                else:
-                    self.log(f"Market is open on {date}, saving the last valid price {last_valid_price} on {last_valid_date}")
-                    with self.conn:
-                        self.conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                        (last_valid_date, ticker, last_valid_price))
-                return last_valid_price
-            self.log(f"No price data found for {ticker} on {date}")
-            return None
-
-        except Exception as e:
-            self.log(f"Error fetching price for {ticker} on {date}: {e}")
-            return None
+        return get_price_service(self.conn).get(ticker, date)
 
     def fetch_and_store_prices_for_multiple_dates(self, ticker, dates):
         """
@@ -140,18 +135,7 @@ class PortfolioDisplayerUtil:
         return prices
 
     def fetch_and_store_latest_price(self, ticker):
-        today = Util.get_today_est_str()
-
-        # 检查是否已有最新价格
-        existing_price = self.conn.execute("""
-            SELECT price FROM daily_prices WHERE date = ? AND ticker = ?
-        """, (today, ticker)).fetchone()
-
-        if existing_price:
-            print(f"Price for {ticker} on {today} already exists: {existing_price[0]}")
-            return existing_price[0]
-
-        return self.fetch_and_store_price(ticker, today)
+        return get_price_service(self.conn).latest(ticker)
 
     def clear_daily_prices(self, date, before=False):
         """
@@ -161,14 +145,11 @@ class PortfolioDisplayerUtil:
         - date (str): 日期，格式为 "YYYY-MM-DD"
         - before (bool): 如果为 True,则删除指定日期之前的记录,否则删除指定日期之后的记录。
         """
-        if before:
-            query = "DELETE FROM daily_prices WHERE date < ?"
-        else:
-            query = "DELETE FROM daily_prices WHERE date >= ?"
-        
-        with self.conn:
-            self.conn.execute(query, (date,))
-            print(f"Cleared daily_prices records {'before' if before else 'after'} {date}")
+        get_price_service(self.conn).clear(date, before)
+        print(f"Cleared daily_prices records {'before' if before else 'after'} {date}")
+
+    def close(self):
+        self.db.release()
 
 class Util:
     @staticmethod
@@ -180,99 +161,21 @@ class Util:
     def fetch_and_store_price(db_conn, ticker, date):
         """
         从 Yahoo Finance 获取指定日期的股票价格，并存储到 daily_prices 表。
+        See PriceService for the caching and persistence rules.
         """
-        # if  date is in TEMP_PRICE_MAP, return the price
-        if date in TEMP_PRICE_MAP:
-            if ticker in TEMP_PRICE_MAP[date]:
-                return TEMP_PRICE_MAP[date][ticker]
-        
-        # Check if the ticker and date already exist in the daily_prices table
-        query = "SELECT price FROM daily_prices WHERE ticker = ? AND date = ?"
-        result = db_conn.execute(query, (ticker, date)).fetchone()
-        if result:
-            return result[0]
-    
-        # fetch the price from Yahoo Finance
-        try:
-            print(f"Fetching price for {ticker} on {date}...")
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-            end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-            Util.log(f"start_date: {start_date}, end_date: {end_date}")
-
-            # yf.download [start_date, end_date), start_date is included, end_date is excluded
-            # https://ranaroussi.github.io/yfinance/reference/api/yfinance.download.html#yfinance.download
-            history = yf.download(ticker, start_date, end_date)
-            if not history.empty:
-                # Get the last valid price and date
-                # Util.log(f"hitory: {history}")
-                price_series = history['Close']
-                last_valid_price = list(round(price_series.iloc[-1], 8))[0]
-                last_valid_date = price_series.index[-1].strftime("%Y-%m-%d")
+        return get_price_service(db_conn).get(ticker, date)
 
-                # if market is close and ticker is not crypto, save the date, price to db
-                """
-                If it's crypto, only save price if today > date, otherwise price will fetch on the fly 
-                If it's not crypto, check if it's market open.
-                    if market is close, means this date will NOT have price data, 
-                        then just save the last open date, price to db
-                    if market is open, means this date will HAVE price data. So the data must be fetched after close.
-                        The price data on last 7 days will be fetched,
-                          and the lastest price will be today's price if today is already closed, 
-                          otherwise the last open date price will be saved.
-                """
-                if ticker in CRYPTO_TICKERS:
-                    # if it's crypto, only save price if today > date, otherwise price will fetch on the fly
-                    today = Util.get_today_est_str()
-                    if today > date:
-                        Util.log(f"Saving the last valid price {last_valid_price} on {date}")
-                        with db_conn:
-                            db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                            (date, ticker, last_valid_price))
-                    else:
-                        Util.log(f"Today is not closed yet, will not save the price data ({last_valid_price}) for {ticker} on {date}")
-                        # update the TEMP_PRICE_MAP
-                        if date not in TEMP_PRICE_MAP:
-                            TEMP_PRICE_MAP[date] = {}
-                        TEMP_PRICE_MAP[date][ticker] = last_valid_price
-                else:
-                    is_market_open = Util.is_market_open(date)
-                    if is_market_open == False:
-                        # if market is close and ticker is not crypto, save the date, price to db
-                        Util.log(f"Market is closed on {date}, saving the last valid price {last_valid_price} on {date}")
-                        with db_conn:
-                            db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                            (date, ticker, last_valid_price))
-                    else:
-                        # if market is open, save the last valid price and date
-                        Util.log(f"Market is open on {date}, saving the last valid price {last_valid_price} on {last_valid_date}")
-                        if date not in TEMP_PRICE_MAP:
-                            TEMP_PRICE_MAP[date] = {}
-                        TEMP_PRICE_MAP[date][ticker] = last_valid_price
-                        with db_conn:
-                            db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                            (last_valid_date, ticker, last_valid_price))
-
-                # is_market_open = Util.is_market_open(date)
-                # if is_market_open == False and ticker not in CRYPTO_TICKERS:
-                #     # if market is close and ticker is not crypto, save the date, price to db
-                #     Util.log(f"Market is closed on {date}, saving the last valid price {last_valid_price} on {date}")
-                #     with db_conn:
-                #         db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                #                         (date, ticker, last_valid_price))
-                # else:
-                #     # if market is open, save the last valid price and date
-                #     Util.log(f"Market is open on {date}, saving the last valid price {last_valid_price} on {last_valid_date}")
-                #     with db_conn:
-                #         db_conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                #                         (last_valid_date, ticker, last_valid_price))
-                return last_valid_price
-            Util.log(f"No price data found for {ticker} on {date}")
-            return None
+    @staticmethod
+    def fetch_and_store_latest_price(db_conn, ticker):
+        return get_price_service(db_conn).latest(ticker)
 
-        except Exception as e:
-            Util.log(f"Error fetching price for {ticker} on {date}: {e}")
-            return None
+    @staticmethod
+    def prefetch_prices(db_conn, pairs, batch_size=None):
+        """
+        Download every missing (ticker, date) price in a few concurrent batched calls,
+        see PriceService.prefetch.
+        """
+        return get_price_service(db_conn).prefetch(pairs, batch_size)
 
     @staticmethod
     def fetch_and_store_prices_for_multiple_dates(db_conn, ticker, dates):
@@ -332,7 +235,7 @@ class Util:
     def is_market_open(date, market="NYSE"):
         """
         Check if the given date is a market open day.
-        Note: 2025-01-09 is closed.
+        Special closures (e.g. 2025-01-09) come from CALENDAR_OVERRIDES in const.py.
 
         Parameters:
             date (str): The date in 'YYYY-MM-DD' format to check.
@@ -341,20 +244,8 @@ class Util:
         Returns:
             bool: True if the market is open on the given date, False otherwise.
         """
-        if date == "2025-01-09":
-            return False
         try:
-            # Parse the input date
-            date = pd.Timestamp(date)
-
-            # Get the market calendar
-            market_calendar = mcal.get_calendar(market)
-
-            # Get the market schedule for the year of the given date
-            schedule = market_calendar.schedule(start_date=date.strftime('%Y-01-01'), end_date=date.strftime('%Y-12-31'))
-
-            # Check if the market is open on the given date
-            return date in schedule.index
+            return get_trading_calendar(market, date).is_open(date)
         except Exception as e:
             print(f"Error: {e}")
             return False
@@ -0,0 +1,171 @@
+from array import array
+from portfolioDisplayer_util import Util
+
+LOT_EPSILON = 1e-12
+
+class LotQueue:
+    """
+    Open lots of one ticker at one source, kept in parallel arrays.
+
+    FIFO relief advances a head pointer and LIFO relief pops from the tail, so each
+    lot is consumed at most once and relief is O(1) amortized. Consumed FIFO lots are
+    compacted away once they make up half of the arrays.
+
+    Fees are spread over the open lots by quantity through a per-share adjustment
+    kept for the whole queue: a lot's unit cost is unit_costs[i] + adjustment, and a
+    lot added later stores its unit cost minus the adjustment, so a fee is O(1).
+    """
+    def __init__(self):
+        self.dates = []
+        self.quantities = array('d')
+        self.unit_costs = array('d')
+        self.head = 0
+        self.quantity = 0.0
+        self.cost = 0.0
+        self.adjustment = 0.0
+
+    def __len__(self):
+        return len(self.quantities) - self.head
+
+    def add(self, date, quantity, cost):
+        self.dates.append(date)
+        self.quantities.append(quantity)
+        self.unit_costs.append(cost / quantity - self.adjustment)
+        self.quantity += quantity
+        self.cost += cost
+
+    def relieve(self, quantity, method="fifo"):
+        """
+        Remove up to quantity shares from the open lots.
+
+        Returns:
+        - list: (lot_date, quantity, cost) for every lot touched
+        """
+        relieved = []
+        while quantity > LOT_EPSILON and len(self):
+            i = self.head if method == "fifo" else len(self.quantities) - 1
+            take = min(quantity, self.quantities[i])
+            cost = take * (self.unit_costs[i] + self.adjustment)
+            relieved.append((self.dates[i], take, cost))
+            self.quantities[i] -= take
+            self.quantity -= take
+            self.cost -= cost
+            quantity -= take
+            if self.quantities[i] <= LOT_EPSILON:
+                if method == "fifo":
+                    self.head += 1
+                else:
+                    self.dates.pop()
+                    self.quantities.pop()
+                    self.unit_costs.pop()
+
+        if self.head and self.head * 2 >= len(self.quantities):
+            del self.dates[:self.head]
+            del self.quantities[:self.head]
+            del self.unit_costs[:self.head]
+            self.head = 0
+        if not len(self):
+            self.quantity, self.cost = 0.0, 0.0
+        return relieved
+
+    def add_cost(self, cost):
+        """Spread a fee over the open lots by quantity, False if nothing is open."""
+        if self.quantity <= LOT_EPSILON:
+            return False
+        self.adjustment += cost / self.quantity
+        self.cost += cost
+        return True
+
+    def split(self, ratio):
+        for i in range(self.head, len(self.quantities)):
+            self.quantities[i] *= ratio
+            self.unit_costs[i] /= ratio
+        self.quantity *= ratio
+        self.adjustment /= ratio
+
+    def clear(self):
+        self.__init__()
+
+
+class LotEngine:
+    """
+    Replay a ticker's transactions against per-source lot queues with FIFO or LIFO relief.
+
+    A sell relieves lots of its own source first, then of the other sources
+    (e.g. coins transferred between exchanges). Realized gains are computed per lot
+    in the same pass that produces the stock_data rows.
+    """
+    METHODS = ("fifo", "lifo")
+
+    def __init__(self, method="fifo", split_index=None):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown lot relief method: {method}")
+        self.method = method
+        self.split_index = split_index
+
+    def replay(self, ticker, transactions):
+        """
+        Parameters:
+        - ticker (str): ticker symbol
+        - transactions (list): (date, source, cost, quantity) tuples sorted by date
+
+        Returns:
+        - (stock_rows, gain_rows, lot_rows): rows for stock_data, realized_gains and realized_lots
+        """
+        queues = {}
+        stock_data, gains, lot_rows = {}, {}, []
+        cost_basis, prev_date = 0, 0
+        for date, source, cost, quantity in transactions:
+            if (cost <= 0 and quantity > 0) or (cost > 0 and quantity < 0):
+                print("Invalid transaction")
+                print(f"date: {date}, ticker: {ticker}, cost: {cost}, quantity: {quantity}")
+                continue
+
+            if self.split_index is not None:
+                ratio = self.split_index.factor(ticker, prev_date, date)
+                if ratio != 1.0:
+                    for queue in queues.values():
+                        queue.split(ratio)
+            prev_date = date
+
+            if cost > 0 and quantity == 0: # fee, charged to the source's lots if it holds any
+                charged = False
+                for lot_source in [source] + sorted(s for s in queues if s != source):
+                    if lot_source in queues and queues[lot_source].add_cost(cost):
+                        charged = True
+                        break
+                if not charged:
+                    Util.log(f"Fee of {cost} on {ticker} on {date} while nothing is held, dropped")
+            elif cost > 0: # buy
+                queues.setdefault(source, LotQueue()).add(date, quantity, cost)
+            else:   # sell or dividend
+                gain = abs(cost)
+                remaining = abs(quantity)
+                proceeds_per_share = abs(cost) / remaining if remaining else 0
+                for lot_source in [source] + sorted(s for s in queues if s != source):
+                    if remaining <= LOT_EPSILON:
+                        break
+                    if lot_source not in queues:
+                        continue
+                    for lot_date, lot_quantity, lot_cost in queues[lot_source].relieve(remaining, self.method):
+                        remaining -= lot_quantity
+                        gain -= lot_cost
+                        lot_rows.append((date, ticker, source, lot_source, lot_date, lot_quantity, lot_cost,
+                                         proceeds_per_share * lot_quantity - lot_cost))
+                if remaining > 0.00001:
+                    Util.log(f"Sold {remaining} more {ticker} than held on {date}, relieved at zero cost")
+                gains[date] = gains.get(date, 0) + gain
+
+            quantity_total = sum(queue.quantity for queue in queues.values())
+            cost_total = sum(queue.cost for queue in queues.values())
+            if quantity_total < 0.00001:
+                for queue in queues.values():
+                    queue.clear()
+                stock_data[date] = (cost_basis, 0)
+                continue
+            cost_basis = round(cost_total / quantity_total, 8)
+            stock_data[date] = (cost_basis, quantity_total)
+
+        stock_rows = [(date, ticker, cost_basis, quantity) for date, (cost_basis, quantity) in stock_data.items()]
+        gain_rows = [(date, ticker, gain) for date, gain in gains.items()]
+        return stock_rows, gain_rows, lot_rows
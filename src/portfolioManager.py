@@ -1,102 +1,53 @@
 import sqlite3
-import yfinance as yf
 import csv
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import pytz
+from itertools import groupby, islice
+import numpy as np
 import os
-import matplotlib.dates as mdates
-from portfolioDisplayer_util import PortfolioDisplayerUtil, Util
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from portfolioDisplayer_util import Util
+from portfolioDatabase import open_database
+from portfolioSchema import bump_versions, migrate
+from portfolioSplits import SplitIndex
+from portfolioLots import LotEngine
+from portfolioCash import CashLedger
+from portfolioValidator import TransactionValidator
+from priceService import get_price_service
+from priceCache import shift_date
 from const import *
+from const_private import *
 
 class PortfolioManager:
-    def __init__(self, db_name="portfolio.db"):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name="portfolio.db", replay=False, cost_basis_method=COST_BASIS_METHOD):
+        """
+        replay (bool): if True, add_transaction only records the transaction row,
+            stock_data and realized_gains are rebuilt afterwards by replay_transactions().
+        cost_basis_method (str): "average", "fifo" or "lifo" relief used by replay_transactions().
+        """
+        self.db = open_database(db_name)
+        self.conn = self.db.writer
+        self.replay = replay
+        self.cost_basis_method = cost_basis_method
         self.create_tables()
         self.stock_splits = self.load_stock_splits(f'{TRANSACTIONS_PATH}stock_split.csv')
 
     def create_tables(self):
-        with self.conn:
-            '''
-            Input data: read from csv file.
-            1. transactions: date, ticker, source, cost, quantity
-            2. daily_cash: date, cash_balance
-            '''
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    date TEXT,
-                    ticker TEXT,
-                    source TEXT,
-                    cost REAL,
-                    quantity REAL,
-                    PRIMARY KEY (date, ticker, source)
-                )
-            """)
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS daily_cash (
-                    date TEXT PRIMARY KEY,
-                    cash_balance REAL
-                )
-            """)
-
-            '''
-            Fetch data: read from Yahoo Finance.
-            1. daily_prices: date, ticker, price
-            '''
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS daily_prices (
-                    date TEXT,
-                    ticker TEXT,
-                    price REAL,
-                    PRIMARY KEY (date, ticker)
-                )
-            """)
-
-            '''
-            Output data: calculate cost_basis, total_quantity and store them.
-            1. stock_data: date, ticker, cost_basis, total_quantity
-            2. gains: date, realized_gain, unrealized_gain
-            '''
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS stock_data (
-                    date TEXT,
-                    ticker TEXT,
-                    cost_basis REAL,
-                    total_quantity REAL,
-                    PRIMARY KEY (date, ticker)
-                )
-            """)
-            self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS realized_gains (
-                date TEXT,
-                ticker TEXT,
-                gain REAL,
-                PRIMARY KEY (date, ticker)
-                )
-            """)
+        """Create or upgrade the tables, see MIGRATIONS in portfolioSchema.py."""
+        migrate(self.conn)
 
     def load_stock_splits(self, file_path):
-        stock_splits = {}
-        with open(file_path, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                date, ticker, before_split, after_split = row
-                if ticker not in stock_splits:
-                    stock_splits[ticker] = []
-                stock_splits[ticker].append((date, float(before_split), float(after_split)))
+        stock_splits = SplitIndex.load(file_path)
         Util.log(f"Loaded stock splits: {stock_splits}")
         return stock_splits
 
     def adjust_quantity_for_splits(self, ticker, old_date, new_date, old_quantity, old_cost_basis):
-        if ticker in self.stock_splits:
-            for split_date, before_split, after_split in sorted(self.stock_splits[ticker]):
-                if (old_date == 0 or old_date < split_date) and new_date >= split_date:
-                    Util.log(f"Adjusting quantity for split: {ticker}, {split_date}, {before_split}, {after_split}")
-                    Util.log(f"Old quantity: {old_quantity}, old cost basis: {old_cost_basis}, old date: {old_date}, new date: {new_date}")
-                    old_quantity *= (after_split / before_split)
-                    old_cost_basis /= (after_split / before_split)
-
-        return old_quantity, old_cost_basis
+        quantity, cost_basis = self.stock_splits.adjust(ticker, old_date, new_date, old_quantity, old_cost_basis)
+        if quantity != old_quantity:
+            Util.log(f"Adjusting quantity for split: {ticker}, {old_date} -> {new_date}, ratio {quantity / old_quantity if old_quantity else None}")
+            Util.log(f"Old quantity: {old_quantity}, old cost basis: {old_cost_basis}, new quantity: {quantity}, new cost basis: {cost_basis}")
+        return quantity, cost_basis
 
     def add_transaction(self, date, ticker, cost, quantity, source):
         # check if the transaction already exists
@@ -120,6 +71,12 @@ class PortfolioManager:
                 VALUES (?, ?, ?, ?, ?)
             """, (date, ticker, cost, quantity, source))
 
+        # In replay mode stock_data and realized_gains are rebuilt in one pass later
+        if self.replay:
+            return
+        self.conn.execute("DELETE FROM daily_valuation WHERE date >= ?", (date,))
+        bump_versions(self.conn, "stock_data", "realized_gains")
+
         '''
         Update realized gains if the transaction has a negative value
         cost > 0, quantity > 0: buy
@@ -152,7 +109,7 @@ class PortfolioManager:
         #   quantity <= 0 
         # if cost > 0, means buy, both cost_basis and quantity will be recalculated
         #   quantity must > 0
-        if (cost_new <= 0 and quantity_new > 0) or (cost_new > 0 and quantity_new <= 0):
+        if (cost_new <= 0 and quantity_new > 0) or (cost_new > 0 and quantity_new < 0):
             print("Invalid transaction")
             print(f"date: {date}, ticker: {ticker}, cost: {cost_new}, quantity: {quantity_new}")
             return 
@@ -172,7 +129,7 @@ class PortfolioManager:
                                                    old_cost_basis=cost_basis)
         
 
-        if cost_new > 0: # buy 
+        if cost_new > 0: # buy or fee
             # calculate new total cost
             total_cost = round(cost_basis * quantity + cost_new, 8)
             # calculate new total quantity
@@ -220,6 +177,126 @@ class PortfolioManager:
                 VALUES (?, ?, ?)
             """, (date, ticker, gain))
 
+    def replay_transactions(self, tickers=None, start_date=None):
+        """
+        Rebuild stock_data and realized_gains from the transactions table.
+
+        Each ticker's merged transactions are sorted once and replayed in memory
+        (buy, sell, dividend, fee and splits), then the results are written in bulk.
+        With fifo / lifo relief the lots cannot be seeded from stock_data,
+        so start_date is ignored and the tickers are replayed from the beginning.
+
+        Parameters:
+        - tickers (list): tickers to replay, all tickers if None
+        - start_date (str): replay from this date "YYYY-MM-DD", rows before it are kept
+        """
+        if self.cost_basis_method != "average":
+            start_date = None
+            lot_engine = LotEngine(self.cost_basis_method, self.stock_splits)
+
+        query = "SELECT ticker, date, source, cost, quantity FROM transactions"
+        conditions, params = [], []
+        if tickers is not None:
+            tickers = list(tickers)
+            if not tickers:
+                return
+            conditions.append(f"ticker IN ({','.join('?' * len(tickers))})")
+            params.extend(tickers)
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY ticker, date, source"
+        rows = self.conn.execute(query, params).fetchall()
+
+        stock_rows, gain_rows, lot_rows = [], [], []
+        replayed = set()
+        for ticker, ticker_rows in groupby(rows, key=lambda row: row[0]):
+            replayed.add(ticker)
+            if self.cost_basis_method != "average":
+                ticker_stock, ticker_gains, ticker_lots = lot_engine.replay(ticker, [row[1:] for row in ticker_rows])
+                stock_rows.extend(ticker_stock)
+                gain_rows.extend(ticker_gains)
+                lot_rows.extend(ticker_lots)
+                continue
+
+            seed = (0, 0, 0)
+            if start_date:
+                seed = self.conn.execute("""
+                    SELECT cost_basis, total_quantity, date FROM stock_data
+                    WHERE ticker = ? AND date < ? ORDER BY date DESC LIMIT 1
+                """, (ticker, start_date)).fetchone() or seed
+            ticker_stock, ticker_gains = self.replay_ticker(ticker, [row[1:] for row in ticker_rows], seed)
+            stock_rows.extend(ticker_stock)
+            gain_rows.extend(ticker_gains)
+
+        # tickers without remaining transactions still need their old rows removed
+        if tickers is not None:
+            replayed.update(tickers)
+
+        with self.conn:
+            for ticker in replayed:
+                for table in ("stock_data", "realized_gains", "realized_lots"):
+                    self.conn.execute(f"DELETE FROM {table} WHERE ticker = ? AND date >= ?",
+                                      (ticker, start_date or ""))
+            self.conn.executemany("INSERT OR REPLACE INTO stock_data (date, ticker, cost_basis, total_quantity) VALUES (?, ?, ?, ?)",
+                                  stock_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO realized_gains (date, ticker, gain) VALUES (?, ?, ?)",
+                                  gain_rows)
+            self.conn.executemany("""
+                INSERT INTO realized_lots (date, ticker, source, lot_source, lot_date, quantity, cost, gain)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, lot_rows)
+            # book totals are recomputed from the earliest replayed date on
+            self.conn.execute("DELETE FROM daily_valuation WHERE date >= ?", (start_date or "",))
+            bump_versions(self.conn, "stock_data", "realized_gains", "realized_lots")
+        print(f"Replayed {len(rows)} transactions into {len(stock_rows)} stock_data rows.")
+
+    def replay_ticker(self, ticker, transactions, seed=(0, 0, 0)):
+        """
+        Replay one ticker's transactions in memory.
+
+        Parameters:
+        - ticker (str): ticker symbol
+        - transactions (list): (date, source, cost, quantity) tuples sorted by date
+        - seed (tuple): (cost_basis, quantity, date) holding before the first transaction
+
+        Returns:
+        - (stock_rows, gain_rows): rows for stock_data and realized_gains
+        """
+        cost_basis, quantity, prev_date = seed
+        stock_data = {}
+        gains = {}
+        for date, _, cost, quantity_new in transactions:
+            if (cost <= 0 and quantity_new > 0) or (cost > 0 and quantity_new < 0):
+                print("Invalid transaction")
+                print(f"date: {date}, ticker: {ticker}, cost: {cost}, quantity: {quantity_new}")
+                continue
+
+            quantity, cost_basis = self.adjust_quantity_for_splits(ticker=ticker,
+                                                                   old_date=prev_date,
+                                                                   new_date=date,
+                                                                   old_quantity=quantity,
+                                                                   old_cost_basis=cost_basis)
+            prev_date = date
+
+            if cost > 0: # buy or fee
+                total_cost = round(cost_basis * quantity + cost, 8)
+                quantity = quantity + quantity_new
+                cost_basis = round(total_cost / quantity, 8) if quantity != 0 else 0
+            else:   # sell or dividend
+                gains[date] = gains.get(date, 0) + abs(cost) - cost_basis * abs(quantity_new)
+                quantity = quantity + quantity_new
+
+            if quantity < 0.00001:
+                quantity = 0
+            stock_data[date] = (cost_basis, quantity)
+
+        stock_rows = [(date, ticker, cost_basis, quantity) for date, (cost_basis, quantity) in stock_data.items()]
+        gain_rows = [(date, ticker, gain) for date, gain in gains.items()]
+        return stock_rows, gain_rows
+
     def set_daily_cash(self, date, cash_balance):
         """
         设置某一天的现金余额。
@@ -228,6 +305,7 @@ class PortfolioManager:
             self.conn.execute("""
                 INSERT OR REPLACE INTO daily_cash (date, cash_balance) VALUES (?, ?)
             """, (date, cash_balance))
+            bump_versions(self.conn, "daily_cash")
         # print(f"Cash balance for {date} set to {cash_balance}.")
 
     def update_future_cost_basis_and_quantity(self, trans_date, ticker, trans_cost, trans_quantity):
@@ -264,54 +342,11 @@ class PortfolioManager:
         return date < today
 
     def fetch_and_store_latest_price(self, ticker):
-        today = Util.get_today_est_str()
-
-        # 检查是否已有最新价格
-        existing_price = self.conn.execute("""
-            SELECT price FROM daily_prices WHERE date = ? AND ticker = ?
-        """, (today, ticker)).fetchone()
-
-        if existing_price:
-            print(f"Price for {ticker} on {today} already exists: {existing_price[0]}")
-            return existing_price[0]
+        return get_price_service(self.conn).latest(ticker)
 
-        # return self.fetch_and_store_price(ticker, today)
-        return Util.fetch_and_store_price(self.conn, ticker, today)
-
-    def fetch_price(self, ticker, date, ori_date):
-        try:
-            row = self.conn.execute("SELECT price FROM daily_prices WHERE date = ? AND ticker = ?", (date, ticker)).fetchone()
-            if row:
-                print(f"Price for {ticker} on {date} already stored: {row[0]}")
-                return row[0]
-
-            stock = yf.Ticker(ticker)
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-            # end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-            end_date = date_obj.strftime("%Y-%m-%d")
-
-            history = yf.download(ticker, start_date, end_date)
-
-            if not history.empty:
-                price_series = history['Close']
-
-                if not price_series.empty:
-                    price = list(round(price_series.iloc[-1], 8))[0]
-                    with self.conn:
-                        self.conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                          (ori_date, ticker, price))
-                    print(f"Fetched and stored price for {ticker} on {ori_date}: {price}")
-                    return price
-                else:
-                    print(f"No price data found for {ticker} on or before {date}")
-                    return None
-            else:
-                print(f"No data available for {ticker} in the date range")
-                return None
-
-        except Exception as e:
-            print(f"Error fetching price for {ticker} on {date}: {e}")
+    def fetch_price(self, ticker, date):
+        """Last close of ticker before date."""
+        return get_price_service(self.conn).get(ticker, shift_date(date, -1))
 
     def get_previous_cash_balance(self, date):
         cash_row = self.conn.execute("""
@@ -351,51 +386,269 @@ class PortfolioManager:
     #             print(f'ticker: {ticker}, cost_basis: {cost_basis}, price: {price}, quantity: {quantity}')
 
     def close(self):
-        self.conn.close()
+        self.db.release()
+
+    @staticmethod
+    def parse_transactions_csv(file_path, transactions=None):
+        """
+        读取 CSV 文件并合并同一天的交易。
+
+        Returns:
+        - dict: {(date, ticker, source): [cost, quantity]}
+        """
+        transactions = {} if transactions is None else transactions
+        source = os.path.splitext(os.path.basename(file_path))[0]
+        with open(file_path, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            for line, row in enumerate(reader, start=1):
+                if len(row) != 4:
+                    raise ValueError(f"line {line}: expected 4 columns, got {len(row)}")
+                date, ticker, cost, quantity = row
+                if len(date) != 10 or date[4] != '-' or date[7] != '-':
+                    raise ValueError(f"line {line}: invalid date {date}")
+                key = (date, ticker, source)  # 以 (日期, 股票代码, 来源) 作为唯一键
+                if key in transactions:
+                    # 合并同一天的交易
+                    transactions[key][0] += float(cost)
+                    transactions[key][1] += float(quantity)
+                else:
+                    transactions[key] = [float(cost), float(quantity)]
+        return transactions
+
+    @staticmethod
+    def parse_transactions_stream(file_path, chunk_rows=CSV_CHUNK_ROWS):
+        """
+        Streaming parser for very large CSV files.
+
+        The file is read chunk_rows lines at a time into columnar buffers
+        (int64 day numbers, ticker ids, float64 cost and quantity) and each chunk is
+        folded into the running per-(day, ticker) sums with np.unique / np.bincount,
+        so memory is bounded by the number of distinct days and tickers, not rows.
+
+        Returns:
+        - list: (date, ticker, source, cost, quantity) tuples merged per day
+        """
+        source = os.path.splitext(os.path.basename(file_path))[0]
+        ticker_ids = {}
+        ticker_space = 1 << 20
+        keys = np.empty(0, dtype=np.int64)
+        costs = np.empty(0, dtype=np.float64)
+        quantities = np.empty(0, dtype=np.float64)
+
+        with open(file_path, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            line = 0
+            while True:
+                rows = list(islice(reader, chunk_rows))
+                if not rows:
+                    break
+                for offset, row in enumerate(rows, start=line + 1):
+                    if len(row) != 4:
+                        raise ValueError(f"line {offset}: expected 4 columns, got {len(row)}")
+                    # datetime64 would read "2024-01" or "2024" as the first day, same check as parse_transactions_csv
+                    date = row[0]
+                    if len(date) != 10 or date[4] != '-' or date[7] != '-':
+                        raise ValueError(f"line {offset}: invalid date {date}")
+                line += len(rows)
+
+                dates, tickers, chunk_costs, chunk_quantities = zip(*rows)
+                days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+                ids = np.fromiter((ticker_ids.setdefault(ticker, len(ticker_ids)) for ticker in tickers),
+                                  dtype=np.int64, count=len(rows))
+
+                keys, inverse = np.unique(np.concatenate([keys, days * ticker_space + ids]), return_inverse=True)
+                costs = np.bincount(inverse, minlength=len(keys),
+                                    weights=np.concatenate([costs, np.array(chunk_costs, dtype=np.float64)]))
+                quantities = np.bincount(inverse, minlength=len(keys),
+                                         weights=np.concatenate([quantities, np.array(chunk_quantities, dtype=np.float64)]))
+
+        tickers = list(ticker_ids)
+        dates = np.datetime_as_string((keys // ticker_space).astype('datetime64[D]'))
+        return [(date, tickers[ticker_id], source, cost, quantity)
+                for date, ticker_id, cost, quantity in zip(dates.tolist(), (keys % ticker_space).tolist(),
+                                                           costs.tolist(), quantities.tolist())]
+
+    @staticmethod
+    def parse_transactions_batch(file_path):
+        """
+        Worker entry point: parse one CSV file into a compact list of
+        (date, ticker, source, cost, quantity) tuples, already merged per day.
+        Files larger than CSV_STREAM_MIN_BYTES use the streaming parser.
+        """
+        if os.path.getsize(file_path) >= CSV_STREAM_MIN_BYTES:
+            return PortfolioManager.parse_transactions_stream(file_path)
+        transactions = PortfolioManager.parse_transactions_csv(file_path)
+        return [(date, ticker, source, cost, quantity) for (date, ticker, source), (cost, quantity) in transactions.items()]
 
     def load_transactions_from_csv(self, file_path):
         """
         从 CSV 文件加载交易记录，并将同一天的交易合并。
         """
         try:
-            transactions = {}
             source = os.path.splitext(os.path.basename(file_path))[0]
-
-            # 读取 CSV 文件并合并同一天的交易
-            with open(file_path, newline='') as csvfile:
-                reader = csv.reader(csvfile)
-                for row in reader:
-                    date, ticker, cost, quantity = row
-                    cost = float(cost)
-                    quantity = float(quantity)
-                    key = (date, ticker, source)  # 以 (日期, 股票代码) 作为唯一键
-
-                    if key in transactions:
-                        # 合并同一天的交易
-                        transactions[key]['cost'] += cost
-                        transactions[key]['quantity'] += quantity
-                    else:
-                        transactions[key] = {'cost': cost, 'quantity': quantity}
+            transactions = self.parse_transactions_csv(file_path)
 
             # 插入合并后的交易
-            for (date, ticker, source), data in sorted(transactions.items(), key=lambda x: x[0][0]):
-                self.add_transaction(date, ticker, data['cost'], data['quantity'], source)
+            for (date, ticker, source), (cost, quantity) in sorted(transactions.items(), key=lambda x: x[0][0]):
+                self.add_transaction(date, ticker, cost, quantity, source)
 
             print(f"Successfully loaded transactions from {source}.")
             
         except Exception as e:
             exit(f"Error reading CSV file {file_path}: {e}")
 
+    def bulk_load_transactions(self, file_paths, workers=LOAD_WORKERS):
+        """
+        批量加载多个交易 CSV 文件。
+
+        Files are parsed and validated in parallel worker processes, each returning its
+        rows merged by (date, ticker, source). This process validates the whole batch
+        (see validate_transactions), merges it and writes
+        them with executemany inside one transaction. Rows that already exist are added to,
+        like add_transaction does. Unless in replay mode, the touched tickers are replayed
+        from their earliest loaded date.
+
+        Parameters:
+        - file_paths (list): CSV files to load
+        - workers (int): number of parser processes, None uses all cores, 1 parses serially
+
+        Returns:
+        - dict: {ticker: earliest loaded date}
+        """
+        start = time.perf_counter()
+        if workers == 1 or len(file_paths) < 2:
+            batches = map(self.parse_transactions_batch, file_paths)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            batches = executor.map(self.parse_transactions_batch, file_paths)
+
+        rows, file_ids = [], []
+        loaded = 0
+        try:
+            for batch in batches:
+                rows.extend(batch)
+                file_ids.extend([loaded] * len(batch))
+                loaded += 1
+        except Exception as e:
+            exit(f"Error reading CSV file {file_paths[loaded]}: {e}")
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        self.validate_transactions(rows, file_ids)
+
+        transactions = {}
+        for date, ticker, source, cost, quantity in rows:
+            key = (date, ticker, source)
+            if key in transactions:
+                transactions[key][0] += cost
+                transactions[key][1] += quantity
+            else:
+                transactions[key] = [cost, quantity]
+
+        affected = {}
+        for date, ticker, _ in transactions:
+            affected[ticker] = min(date, affected.get(ticker, date))
+
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO transactions (date, ticker, source, cost, quantity) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (date, ticker, source) DO UPDATE
+                SET cost = cost + excluded.cost, quantity = quantity + excluded.quantity
+            """, [(date, ticker, source, cost, quantity) for (date, ticker, source), (cost, quantity) in transactions.items()])
+
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {len(transactions)} transactions from {len(file_paths)} files in {elapsed:.2f}s "
+              f"({len(transactions) / max(elapsed, 1e-9):.0f} rows/s).")
+
+        if not self.replay:
+            for ticker, start_date in sorted(affected.items()):
+                self.replay_transactions(tickers=[ticker], start_date=start_date)
+        return affected
+
+    def validate_transactions(self, rows, file_ids=None, replaced_sources=()):
+        """
+        Validate rows before they are written, see TransactionValidator.
+        Warnings are printed and the rows are written as usual, any error (a sign error,
+        or a check raised to "error" in VALIDATION_SEVERITY) aborts the load before a
+        single write.
+
+        Parameters:
+        - rows (list): (date, ticker, source, cost, quantity) tuples about to be written
+        - file_ids (list): index of the file each row came from
+        - replaced_sources (set): sources whose stored rows are replaced by rows instead of added to
+        """
+        if not VALIDATE_TRANSACTIONS:
+            return
+        replaced_sources = set(replaced_sources)
+        tickers = {row[1] for row in rows}
+        for source in replaced_sources:
+            tickers.update(row[0] for row in self.conn.execute(
+                "SELECT DISTINCT ticker FROM transactions WHERE source = ?", (source,)))
+
+        history = []
+        if tickers:
+            tickers = sorted(tickers)
+            history = [row for row in self.conn.execute(f"""
+                SELECT date, ticker, source, cost, quantity FROM transactions
+                WHERE ticker IN ({','.join('?' * len(tickers))})
+            """, tickers) if row[2] not in replaced_sources]
+
+        validator = TransactionValidator(split_index=self.stock_splits,
+                                         known_tickers=set(STOCK_TICKERS) | set(CRYPTO_TICKERS))
+        report = validator.validate(rows, file_ids, history=history,
+                                    history_keys=[] if replaced_sources else [row[:3] for row in history])
+        if not report.ok:
+            exit(f"Transaction validation failed, nothing was written.\n{report}")
+        if report.warnings:
+            print(f"Transaction validation: {report}")
+        return report
+
     def load_daily_cash_from_csv(self, file_path):
         """
         从 CSV 文件加载每日现金余额。
         """
+        start = time.perf_counter()
         with open(file_path, newline='') as csvfile:
             reader = csv.reader(csvfile)
+            rows = []
             for row in reader:
                 date, _, cash_balance, _ = row  # 假设格式为 yyyy-mm-dd, cash, amount, 1
-                self.set_daily_cash(date, float(cash_balance))
-        print(f"Successfully loaded daily cash from {file_path}")
+                rows.append((date, float(cash_balance)))
+
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO daily_cash (date, cash_balance) VALUES (?, ?)", rows)
+            bump_versions(self.conn, "daily_cash")
+
+        elapsed = time.perf_counter() - start
+        print(f"Successfully loaded daily cash from {file_path} "
+              f"({len(rows)} rows, {len(rows) / max(elapsed, 1e-9):.0f} rows/s)")
+
+    def load_cash(self, cash_path, transfers_path=CASH_TRANSFERS_PATH):
+        """
+        Rebuild daily_cash. With a transfers file the balances are derived from
+        deposits, withdrawals and the signed cost of every transaction,
+        otherwise the point balances in cash_path are loaded.
+        """
+        self.clear_table("daily_cash")
+        if not os.path.exists(transfers_path):
+            if not os.path.exists(cash_path):
+                print(f"No cash file {cash_path}, daily_cash is left empty.")
+                return
+            self.load_daily_cash_from_csv(cash_path)
+            return
+
+        # buying costs cash (cost > 0), selling and dividends add cash (cost < 0)
+        changes = CashLedger.read_transfers(transfers_path)
+        changes += [(date, -cost) for date, cost in self.conn.execute(
+            "SELECT date, SUM(cost) FROM transactions GROUP BY date")]
+        ledger = CashLedger.from_changes(changes)
+        rows = ledger.change_rows()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO daily_cash (date, cash_balance) VALUES (?, ?)", rows)
+            bump_versions(self.conn, "daily_cash")
+        print(f"Derived {len(rows)} daily cash rows from {transfers_path} and transactions.")
 
     def load_transactions_from_folder(self, folder_path):
         """
@@ -407,11 +660,132 @@ class PortfolioManager:
             return
 
         # 遍历文件夹中的所有 CSV 文件
-        for file_name in os.listdir(folder_path):
-            if file_name.endswith('.csv') and file_name != 'demo_msft.csv':
-                file_path = os.path.join(folder_path, file_name)
-                Util.log(f"Loading transactions from file: {file_name}")
-                self.load_transactions_from_csv(file_path)
+        file_paths = self.list_transaction_files(folder_path)
+        Util.log(f"Loading transactions from files: {[os.path.basename(path) for path in file_paths]}")
+        return self.bulk_load_transactions(file_paths)
+
+    @staticmethod
+    def list_transaction_files(folder_path):
+        """
+        列出文件夹下所有交易 CSV 文件的路径
+        """
+        if not os.path.exists(folder_path):
+            return []
+        return [os.path.join(folder_path, file_name) for file_name in sorted(os.listdir(folder_path))
+                if file_name.endswith('.csv') and file_name != 'demo_msft.csv']
+
+    @staticmethod
+    def hash_file(file_path):
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def sync_transactions(self, folder_paths, cash_path):
+        """
+        Incrementally load transactions driven by the file_manifest table.
+
+        Files whose size and mtime (or content hash) match the manifest are skipped.
+        A changed or removed file reloads its source and replays only the tickers whose
+        merged transactions changed, starting from the earliest changed date.
+        An empty manifest triggers a full rebuild.
+        """
+        split_path = f'{TRANSACTIONS_PATH}stock_split.csv'
+        # cash, splits and transfers are optional, a missing one is left out of the manifest
+        optional_inputs = [cash_path, split_path, CASH_TRANSFERS_PATH]
+        inputs = [path for path in optional_inputs if os.path.exists(path)]
+        files = [path for folder in folder_paths for path in self.list_transaction_files(folder)]
+        manifest = {row[0]: row[1:] for row in self.conn.execute("SELECT path, size, mtime, hash FROM file_manifest")}
+
+        if not manifest:
+            print("No file manifest found, rebuilding all tables...")
+            for table in ("transactions", "stock_data", "daily_cash", "realized_gains"):
+                self.clear_table(table)
+            self.bulk_load_transactions(files)
+            self.replay_transactions()
+            self.load_cash(cash_path)
+            self.update_manifest(files + inputs)
+            return
+
+        changed = []
+        for path in files + inputs:
+            stat = os.stat(path)
+            entry = manifest.get(path)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+                continue
+            if entry and entry[2] == self.hash_file(path):
+                self.update_manifest([path])
+                continue
+            changed.append(path)
+        removed = set(manifest) - set(files) - set(inputs)
+
+        if not changed and not removed:
+            print("All transaction files are up to date.")
+            return
+
+        # Files with the same name share one source, so reload the source as a whole
+        sources = {os.path.splitext(os.path.basename(path))[0]
+                   for path in changed + list(removed) if path not in optional_inputs}
+        source_rows = {}
+        rows, file_ids = [], []
+        for source in sorted(sources):
+            new_rows = source_rows[source] = {}
+            for file_id, path in enumerate(files):
+                if os.path.splitext(os.path.basename(path))[0] == source:
+                    try:
+                        file_rows = self.parse_transactions_csv(path)
+                    except Exception as e:
+                        exit(f"Error reading CSV file {path}: {e}")
+                    rows.extend((date, ticker, source, cost, quantity) for (date, ticker, source), (cost, quantity) in file_rows.items())
+                    file_ids.extend([file_id] * len(file_rows))
+                    for key, (cost, quantity) in file_rows.items():
+                        new_rows.setdefault(key, [0, 0])
+                        new_rows[key][0] += cost
+                        new_rows[key][1] += quantity
+        self.validate_transactions(rows, file_ids, replaced_sources=sources)
+
+        affected = {}   # ticker: earliest changed date
+        for source, new_rows in source_rows.items():
+            old_rows = {(date, ticker, source): [cost, quantity] for date, ticker, cost, quantity in self.conn.execute(
+                "SELECT date, ticker, cost, quantity FROM transactions WHERE source = ?", (source,))}
+
+            for key in set(new_rows) | set(old_rows):
+                old, new = old_rows.get(key, [0, 0]), new_rows.get(key, [0, 0])
+                if key not in old_rows or key not in new_rows or abs(old[0] - new[0]) > 1e-9 or abs(old[1] - new[1]) > 1e-9:
+                    date, ticker, _ = key
+                    affected[ticker] = min(date, affected.get(ticker, date))
+
+            with self.conn:
+                self.conn.execute("DELETE FROM transactions WHERE source = ?", (source,))
+                self.conn.executemany("INSERT INTO transactions (date, ticker, source, cost, quantity) VALUES (?, ?, ?, ?, ?)",
+                                      [(date, ticker, source, cost, quantity) for (date, ticker, source), (cost, quantity) in new_rows.items()])
+            print(f"Reloaded transactions from {source}.")
+
+        if split_path in changed or split_path in removed:
+            # splits can move any earlier holding, replay everything
+            self.stock_splits = self.load_stock_splits(split_path)
+            self.replay_transactions()
+        else:
+            for ticker, start_date in sorted(affected.items()):
+                Util.log(f"Replaying {ticker} from {start_date}")
+                self.replay_transactions(tickers=[ticker], start_date=start_date)
+
+        derived_cash = os.path.exists(CASH_TRANSFERS_PATH)
+        if cash_path in changed or cash_path in removed or CASH_TRANSFERS_PATH in changed or CASH_TRANSFERS_PATH in removed or (derived_cash and sources):
+            self.load_cash(cash_path)
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM file_manifest WHERE path = ?", [(path,) for path in removed])
+        self.update_manifest(changed)
+
+    def update_manifest(self, paths):
+        rows = []
+        for path in paths:
+            stat = os.stat(path)
+            rows.append((path, stat.st_size, stat.st_mtime, self.hash_file(path)))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO file_manifest (path, size, mtime, hash) VALUES (?, ?, ?, ?)", rows)
 
     def clear_table(self, table_name):
         """
@@ -423,6 +797,7 @@ class PortfolioManager:
         try:
             with self.conn:
                 self.conn.execute(f"DELETE FROM {table_name}")
+                bump_versions(self.conn, table_name)
             print(f"All data from table '{table_name}' has been cleared.")
         except sqlite3.Error as e:
             print(f"Error clearing table '{table_name}': {e}")
@@ -1,53 +1,27 @@
 import matplotlib.pyplot as plt
-import sqlite3
-import yfinance as yf
-from datetime import datetime, timedelta
+from datetime import timedelta
 import matplotlib.dates as mdates
 from portfolioDisplayer_util import PortfolioDisplayerUtil, Util
+from portfolioValuation import DailyValuation
+from priceService import get_price_service
 from const import *
+from portfolioDatabase import open_database
 
 class Plotter:
     def __init__(self, db_name="portfolio.db"):
-      self.conn = sqlite3.connect(db_name)
+      self.db = open_database(db_name)
+      # charts store prefetched closes and book totals, so they read on the writer too
+      self.conn = self.db.writer
+      self.pdu = PortfolioDisplayerUtil(db_name)
 
     def fetch_and_store_price(self, ticker, date):
         """
         从 Yahoo Finance 获取指定日期的股票价格，并存储到 daily_prices 表。
         """
-        try:
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            start_date = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-            end_date = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
-
-            history = yf.download(ticker, start_date, end_date)
-            if not history.empty:
-                price_series = history['Close']
-                price = list(round(price_series.iloc[-1], 8))[0]
-                with self.conn:
-                    self.conn.execute("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
-                                      (date, ticker, price))
-                print(f"Fetched and stored price for {ticker} on {date}: {price}")
-                return price
-            print(f"No price data found for {ticker} on {date}")
-            return None
-
-        except Exception as e:
-            print(f"Error fetching price for {ticker} on {date}: {e}")
-            return None
+        return get_price_service(self.conn).get(ticker, date)
 
     def fetch_and_store_latest_price(self, ticker):
-        today = Util.get_today_est_str()
-
-        # 检查是否已有最新价格
-        existing_price = self.conn.execute("""
-            SELECT price FROM daily_prices WHERE date = ? AND ticker = ?
-        """, (today, ticker)).fetchone()
-
-        if existing_price:
-            print(f"Price for {ticker} on {today} already exists: {existing_price[0]}")
-            return existing_price[0]
-
-        return self.fetch_and_store_price(ticker, today)
+        return get_price_service(self.conn).latest(ticker)
 
     def plot_pie_chart_with_cash(self, file_name="results/portfolio_pie_chart.png"):
         """
@@ -103,54 +77,24 @@ class Plotter:
 
     def plot_line_chart(self, file_name, end_date, time_period, time_str, number_of_points=NUM_OF_PLOT):
         # dates = sorted(set(row[0] for row in self.conn.execute("SELECT date FROM transactions")))
-        total_values = []
-        total_costs = []
-        total_profits = []
-        pdu = PortfolioDisplayerUtil()
-
         # calculate dates from ytd
         if time_period == "YTD":
             time_period = Util.calculate_ytd_date_delta(end_date)
 
-        # 获取所有出现过的ticker列表
-        tickers = set(row[0] for row in self.conn.execute("SELECT DISTINCT ticker FROM stock_data"))
-
         # Get dates
         dates = Util.get_evenly_spaced_dates(start_date = end_date - timedelta(days=time_period),
                                                                 end_date=end_date,
                                                                 num_dates=number_of_points)
-        for i, date in enumerate(dates):
-            day_profit = 0
-            day_cost = 0
-            day_value = 0
-            for ticker in tickers:
-                # Get prices, quantity, and cost basis
-                quantity = pdu.get_stock_quantity(ticker=ticker, 
-                                                    date=date)
-                cost_basis = pdu.get_cost_basis(ticker=ticker,
-                                                date=date)
-                
-                # skip if quantity is 0
-                if quantity == 0:
-                    continue
-
-                price = Util.fetch_and_store_price(db_conn=self.conn,
-                                                   ticker=ticker,
-                                                   date=date)
-
-                value = price * quantity
-                cost = cost_basis * quantity
-                profit = value - cost
-                day_profit += profit
-                day_cost += cost
-                day_value += value
-
-            total_values.append(day_value)
-            total_costs.append(day_cost)
-            total_profits.append(day_profit)
-
-            latest_cost = total_costs[-1]
-
+        # book totals of past days are read from daily_valuation, only today is valued on the spot
+        valuation = DailyValuation(self.conn).get_many(dates)
+        total_costs = list(valuation["total_cost"])
+        total_profits = list(valuation["unrealized_gain"])
+        latest_cost = total_costs[-1]
+
+        if valuation["missing"].any():
+            summary = get_price_service(self.conn).missing_summary(dates=set(dates))
+            print(f"Missing prices left out of {file_name} on {int((valuation['missing'] > 0).sum())} dates"
+                  + (f":\n{summary}" if summary else ""))
         self.plot_asset_value_vs_cost_util(latest_cost, total_profits, dates, file_name, time_str)
 
     def plot_line_chart_ends_at_today(self, file_name, time_period, time_str, number_of_points=NUM_OF_PLOT):
@@ -199,7 +143,7 @@ class Plotter:
         total_values = []
         total_costs = []
         total_profits = []
-        pdu = PortfolioDisplayerUtil()
+        pdu = self.pdu
 
         # calculate dates from ytd
         if time_period == "YTD":
@@ -211,21 +155,25 @@ class Plotter:
                                                                 end_date=today,
                                                                 num_dates=number_of_points)
         emtpy_dates = []
+        quantities = pdu.positions.take("quantity", dates, [ticker])[:, 0]
+        cost_bases = pdu.positions.take("cost_basis", dates, [ticker])[:, 0]
+        holdings = {dates[i]: (quantities[i], cost_bases[i]) for i in quantities.nonzero()[0]}
+        Util.prefetch_prices(self.conn, [(ticker, date) for date in holdings])
+
         for i, date in enumerate(dates):
-            # Get prices, quantity, and cost basis
-            quantity = pdu.get_stock_quantity(ticker=ticker, 
-                                                date=date)
-            cost_basis = pdu.get_cost_basis(ticker=ticker,
-                                            date=date)
-            
             # skip if quantity is 0
-            if quantity == 0:
+            if date not in holdings:
                 emtpy_dates.append(date)
                 continue
+            quantity, cost_basis = holdings[date]
 
             price = Util.fetch_and_store_price(db_conn=self.conn,
                                                 ticker=ticker,
                                                 date=date)
+            if price is None:
+                # missing price (e.g. delisted), leave the date out
+                emtpy_dates.append(date)
+                continue
 
             value = price * quantity
             cost = cost_basis * quantity
@@ -244,5 +192,6 @@ class Plotter:
         self.plot_asset_value_vs_cost_util(latest_cost, total_profits, dates, file_name, time_str)
 
     def close(self):
-        self.conn.close()
+        self.pdu.close()
+        self.db.release()
         print("Database connection closed.")
\ No newline at end of file
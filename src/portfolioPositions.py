@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+from datetime import date as date_cls
+import numpy as np
+from portfolioDatabase import manager_of
+from portfolioSchema import table_versions
+from portfolioSplits import SplitIndex
+from priceService import today_est
+from const import *
+
+class PositionStore:
+    """
+    Forward-filled positions of the whole book as dense float64 matrices, one row per
+    calendar day from the first stock_data date to today, one column per ticker.
+
+    - quantity / cost_basis: the last stock_data row on or before the day, carried
+      through later splits, as get_stock_quantity / get_cost_basis return them.
+    - realized_gain: SUM(gain) of realized_gains up to and including the day.
+    - close: last close stored in daily_prices on or before the day, NaN before the
+      first one. PriceService still decides whether a stored close is fresh enough.
+
+    The matrices are saved as .npy files in a directory next to the database and
+    opened memory-mapped, so a date range is a zero-copy slice. meta.json keeps a
+    signature of the table versions (see bump_versions) each part was built from,
+    so refresh() is one primary key lookup and rebuilds a part only after a writer
+    changed its tables.
+    """
+    POSITION_FIELDS = ("quantity", "cost_basis", "realized_gain")
+    FIELDS = POSITION_FIELDS + ("close",)
+    VERSION = 1
+
+    def __init__(self, conn, path=None):
+        self.conn = conn
+        self.path = path
+        self.start = None # YYYY-MM-DD of row 0
+        self.start_day = 0 # ordinal of row 0
+        self.days = 0
+        self.tickers = []
+        self.ticker_ids = {}
+        self.arrays = {}
+        self.signatures = {}
+
+    def positions_signature(self, end):
+        versions = table_versions(self.conn, "stock_data", "realized_gains")
+        split_path = f'{TRANSACTIONS_PATH}stock_split.csv'
+        splits = [os.path.getmtime(split_path), os.path.getsize(split_path)] if os.path.exists(split_path) else None
+        return hashlib.md5(json.dumps([self.VERSION, end, versions, splits]).encode()).hexdigest()
+
+    def prices_signature(self):
+        versions = table_versions(self.conn, "daily_prices")
+        return hashlib.md5(json.dumps([self.positions_key(), versions]).encode()).hexdigest()
+
+    def positions_key(self):
+        return self.signatures.get("positions")
+
+    def day_strings(self):
+        start = np.datetime64(self.start, 'D') if self.start else np.datetime64('1970-01-01', 'D')
+        return np.arange(start, start + self.days).astype('U10')
+
+    def index_of(self, dates):
+        """Row of each YYYY-MM-DD date, -1 before the first row, clipped to the last row."""
+        ordinals = np.array([date_cls.fromisoformat(date[:10]).toordinal() for date in dates], dtype=np.int64)
+        rows = ordinals - self.start_day
+        return np.where(rows < 0, -1, np.minimum(rows, self.days - 1))
+
+    @staticmethod
+    def forward_fill(column, rows, values):
+        """Set values at rows and carry each one forward, rows before the first value stay NaN."""
+        column[:] = np.nan
+        column[rows] = values
+        index = np.where(np.isnan(column), 0, np.arange(len(column)))
+        index = np.maximum.accumulate(index)
+        filled = column[index]
+        if len(rows):
+            filled[:rows.min()] = np.nan
+        column[:] = filled
+        return index
+
+    def build_positions(self, end):
+        """Rebuild quantity, cost_basis and realized_gain from stock_data and realized_gains."""
+        first, last = self.conn.execute("""
+            SELECT MIN(date), MAX(date) FROM (SELECT date FROM stock_data UNION ALL SELECT date FROM realized_gains)
+        """).fetchone()
+        self.tickers = sorted(row[0] for row in self.conn.execute(
+            "SELECT ticker FROM stock_data UNION SELECT ticker FROM realized_gains"))
+        self.ticker_ids = {ticker: i for i, ticker in enumerate(self.tickers)}
+        if first is None:
+            self.start, self.start_day, self.days = None, 0, 0
+        else:
+            self.start = first[:10]
+            self.start_day = date_cls.fromisoformat(self.start).toordinal()
+            self.days = date_cls.fromisoformat(max(end, last[:10])).toordinal() - self.start_day + 1
+        shape = (self.days, len(self.tickers))
+        quantity, cost_basis, realized_gain = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        days = self.day_strings()
+        splits = SplitIndex.load(f'{TRANSACTIONS_PATH}stock_split.csv')
+
+        column = np.empty(self.days)
+        for ticker, rows in self.grouped("SELECT ticker, date, total_quantity, cost_basis FROM stock_data ORDER BY ticker, date"):
+            i = self.ticker_ids[ticker]
+            row_days = self.index_of([date for date, _, _ in rows])
+            source = self.forward_fill(column, row_days, [q for _, q, _ in rows])
+            quantity[:, i] = np.nan_to_num(column)
+            self.forward_fill(column, row_days, [c for _, _, c in rows])
+            cost_basis[:, i] = np.nan_to_num(column)
+            if ticker in splits:
+                # carry each row through the splits between its date and the day
+                split_dates = np.array(splits.dates[ticker], dtype='U10')
+                factors = np.array(splits.factors[ticker])
+                row_dates = np.array([date for date, _, _ in rows], dtype='U10')
+                row_of_day = np.searchsorted(row_days, source, side='right') - 1
+                ratio = factors[np.searchsorted(split_dates, days, side='right')] \
+                    / factors[np.searchsorted(split_dates, row_dates[np.maximum(row_of_day, 0)], side='right')]
+                quantity[:, i] *= ratio
+                cost_basis[:, i] /= ratio
+
+        for ticker, rows in self.grouped("SELECT ticker, date, gain FROM realized_gains ORDER BY ticker, date"):
+            gains = np.zeros(self.days)
+            np.add.at(gains, self.index_of([date for date, _ in rows]), [gain or 0 for _, gain in rows])
+            realized_gain[:, self.ticker_ids[ticker]] = np.cumsum(gains)
+
+        self.arrays.update(quantity=quantity, cost_basis=cost_basis, realized_gain=realized_gain)
+
+    def build_close(self):
+        """Rebuild close from daily_prices for the current rows and tickers."""
+        close = np.full((self.days, len(self.tickers)), np.nan)
+        column = np.empty(self.days)
+        start = self.start or ""
+        for ticker, rows in self.grouped("SELECT ticker, date, price FROM daily_prices ORDER BY ticker, date"):
+            i = self.ticker_ids.get(ticker)
+            if i is None or not self.days:
+                continue
+            # a close before the first row still carries into it
+            earlier = [row for row in rows if row[0][:10] < start]
+            rows = earlier[-1:] + [row for row in rows if row[0][:10] >= start]
+            rows = [(max(date[:10], start), price) for date, price in rows if price is not None]
+            if not rows:
+                continue
+            self.forward_fill(column, self.index_of([date for date, _ in rows]), [price for _, price in rows])
+            close[:, i] = column
+        self.arrays["close"] = close
+
+    def grouped(self, query):
+        rows, current = [], None
+        for row in self.conn.execute(query):
+            if row[0] != current:
+                if rows:
+                    yield current, rows
+                rows, current = [], row[0]
+            rows.append(row[1:])
+        if rows:
+            yield current, rows
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        for field, array in self.arrays.items():
+            file_path = os.path.join(self.path, f"{field}.npy")
+            np.save(f"{file_path}.tmp.npy", array)
+            os.replace(f"{file_path}.tmp.npy", file_path)
+        # meta is written last, a crash in between leaves a signature that does not match
+        with open(os.path.join(self.path, "meta.json.tmp"), "w") as f:
+            json.dump({"start": self.start, "days": self.days, "tickers": self.tickers, "signatures": self.signatures}, f)
+        os.replace(os.path.join(self.path, "meta.json.tmp"), os.path.join(self.path, "meta.json"))
+        self.open_arrays()
+
+    def load(self):
+        """Read meta.json and map the saved matrices, False if nothing usable is saved."""
+        meta_path = os.path.join(self.path or "", "meta.json")
+        if not self.path or not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.start, self.days, self.tickers = meta["start"], meta["days"], meta["tickers"]
+        self.start_day = date_cls.fromisoformat(self.start).toordinal() if self.start else 0
+        self.ticker_ids = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.signatures = meta["signatures"]
+        try:
+            self.open_arrays()
+        except (OSError, ValueError):
+            self.signatures = {}
+            return False
+        return True
+
+    def open_arrays(self):
+        self.arrays = {field: np.load(os.path.join(self.path, f"{field}.npy"), mmap_mode='r') for field in self.FIELDS}
+
+    def refresh(self):
+        """
+        Rebuild the parts whose tables changed since they were built.
+
+        Returns:
+        - PositionStore: self
+        """
+        end = today_est()
+        positions_signature = self.positions_signature(end)
+        rebuilt = False
+        if self.signatures.get("positions") != positions_signature:
+            self.build_positions(end)
+            self.signatures = {"positions": positions_signature}
+            rebuilt = True
+        prices_signature = self.prices_signature()
+        if self.signatures.get("prices") != prices_signature:
+            self.build_close()
+            self.signatures["prices"] = prices_signature
+            rebuilt = True
+        if rebuilt:
+            self.save()
+        return self
+
+    def take(self, field, dates, tickers=None):
+        """
+        Values of field on each date for each ticker (all tickers by default).
+
+        Returns:
+        - np.ndarray: len(dates) x len(tickers), 0 (NaN for close) before the first row
+          and for unknown tickers
+        """
+        tickers = self.tickers if tickers is None else tickers
+        fill = np.nan if field == "close" else 0.0
+        result = np.full((len(dates), len(tickers)), fill)
+        if not self.days or not len(dates):
+            return result
+        rows = self.index_of(dates)
+        columns = np.array([self.ticker_ids.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+        known = columns >= 0
+        valid = rows >= 0
+        result[np.ix_(valid, known)] = self.arrays[field][np.ix_(rows[valid], columns[known])]
+        return result
+
+    def at(self, date):
+        """
+        Every field on one date as zero-copy rows indexed like self.tickers.
+
+        Returns:
+        - dict: field: np.ndarray, None before the first row
+        """
+        row = self.index_of([date])[0] if self.days else -1
+        if row < 0:
+            return None
+        return {field: self.arrays[field][row] for field in self.FIELDS}
+
+    def window(self, start, end):
+        """
+        Every field from start to end (both inclusive, clipped to the stored rows)
+        as zero-copy slices.
+
+        Returns:
+        - (dates, dict): day strings and field: np.ndarray of shape days x tickers
+        """
+        if not self.days:
+            return np.array([], dtype='U10'), {field: np.zeros((0, len(self.tickers))) for field in self.FIELDS}
+        first, last = self.index_of([start, end])
+        first = max(first, 0)
+        last = last + 1 if last >= 0 else 0
+        return self.day_strings()[first:last], {field: self.arrays[field][first:last] for field in self.FIELDS}
+
+    @classmethod
+    def open(cls, conn):
+        """Store saved next to conn's database file, an in-memory database keeps it in memory."""
+        db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+        store = cls(conn, f"{os.path.splitext(db_path)[0]}{POSITION_STORE_SUFFIX}" if db_path else None)
+        store.load()
+        return store
+
+
+_stores = {} # connection opened outside open_database(): its own PositionStore
+
+def get_position_store(conn):
+    """
+    Position store of conn's database, refreshed if its tables changed. Like the
+    PriceService it is created once per ConnectionManager and bound to the writer,
+    any other connection gets its own store.
+    """
+    manager = manager_of(conn)
+    if manager is not None:
+        store = manager.shared("positions", PositionStore.open)
+    else:
+        if conn not in _stores:
+            _stores[conn] = PositionStore.open(conn)
+        store = _stores[conn]
+    return store.refresh()
@@ -0,0 +1,246 @@
+#!/usr/local/bin/python3
+"""
+Versioned schema of portfolio.db.
+
+Every migration runs once, in order, and PRAGMA user_version records the last one
+applied, so an existing portfolio.db is upgraded in place the next time it is
+opened. New schema changes are appended to MIGRATIONS, never edited in place.
+
+Usage:
+    ./portfolioSchema.py [portfolio.db]   # migrate and check the hot query plans
+"""
+import sqlite3
+import sys
+from const import *
+
+MIGRATIONS = [
+    (1, "base tables", [
+        # Input data: read from csv file.
+        # 1. transactions: date, ticker, source, cost, quantity
+        # 2. daily_cash: date, cash_balance
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            date TEXT,
+            ticker TEXT,
+            source TEXT,
+            cost REAL,
+            quantity REAL,
+            PRIMARY KEY (date, ticker, source)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_cash (
+            date TEXT PRIMARY KEY,
+            cash_balance REAL
+        )
+        """,
+        # Fetch data: read from the price provider.
+        # 1. daily_prices: date, ticker, price
+        # 2. price_coverage: date ranges whose closes are all stored
+        # 3. price_misses: date ranges the provider had no data for
+        """
+        CREATE TABLE IF NOT EXISTS daily_prices (
+            date TEXT,
+            ticker TEXT,
+            price REAL,
+            PRIMARY KEY (date, ticker)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS price_coverage (
+            ticker TEXT,
+            start TEXT,
+            end TEXT,
+            PRIMARY KEY (ticker, start)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS price_misses (
+            ticker TEXT,
+            start TEXT,
+            end TEXT,
+            checked_at REAL,
+            PRIMARY KEY (ticker, start, end)
+        )
+        """,
+        # Output data: calculate cost_basis, total_quantity and store them.
+        # 1. stock_data: date, ticker, cost_basis, total_quantity
+        # 2. realized_gains: date, ticker, gain
+        # 3. realized_lots: per lot realized gains (fifo / lifo only)
+        """
+        CREATE TABLE IF NOT EXISTS stock_data (
+            date TEXT,
+            ticker TEXT,
+            cost_basis REAL,
+            total_quantity REAL,
+            PRIMARY KEY (date, ticker)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS realized_gains (
+            date TEXT,
+            ticker TEXT,
+            gain REAL,
+            PRIMARY KEY (date, ticker)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS realized_lots (
+            date TEXT,
+            ticker TEXT,
+            source TEXT,
+            lot_source TEXT,
+            lot_date TEXT,
+            quantity REAL,
+            cost REAL,
+            gain REAL
+        )
+        """,
+        # Load state: source files already loaded into the tables.
+        # 1. file_manifest: path, size, mtime, hash
+        """
+        CREATE TABLE IF NOT EXISTS file_manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            hash TEXT
+        )
+        """,
+    ]),
+    # the primary keys start with date, the hot queries filter on ticker first
+    (2, "covering (ticker, date) indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_stock_data_ticker_date ON stock_data (ticker, date, total_quantity, cost_basis)",
+        "CREATE INDEX IF NOT EXISTS idx_realized_gains_ticker_date ON realized_gains (ticker, date, gain)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_cash_date ON daily_cash (date, cash_balance)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_prices_ticker_date ON daily_prices (ticker, date, price)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_ticker_date ON transactions (ticker, date, source, cost, quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_source ON transactions (source)",
+        "CREATE INDEX IF NOT EXISTS idx_realized_lots_ticker_date ON realized_lots (ticker, date)",
+    ]),
+    # Derived data: book totals per day, see DailyValuation in portfolioValuation.py
+    (3, "daily valuation", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_valuation (
+            date TEXT PRIMARY KEY,
+            total_value REAL,
+            total_cost REAL,
+            unrealized_gain REAL,
+            realized_gain REAL,
+            missing INTEGER
+        ) WITHOUT ROWID
+        """,
+    ]),
+    # Cache keys: bumped by the writers of each table, see bump_versions
+    (4, "table versions", [
+        "CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID",
+        # random per file, caches saved next to a deleted and recreated database never match it
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('database', abs(random()))",
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# queries run per ticker per date, they must be answered from an index alone
+HOT_QUERIES = {
+    "stock_quantity": ("SELECT total_quantity, date FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+                       ("AAPL", "2024-01-01")),
+    "cost_basis": ("SELECT cost_basis, date FROM stock_data WHERE ticker = ? AND date <= ? ORDER BY date DESC LIMIT 1",
+                   ("AAPL", "2024-01-01")),
+    "realized_gain": ("SELECT SUM(gain) FROM realized_gains WHERE ticker = ? AND date <= ?", ("AAPL", "2024-01-01")),
+    "cash_balance": ("SELECT cash_balance FROM daily_cash WHERE date <= ? ORDER BY date DESC LIMIT 1", ("2024-01-01",)),
+    "price_series": ("SELECT date, price FROM daily_prices WHERE ticker = ? ORDER BY date", ("AAPL",)),
+    "valuation": ("SELECT date, total_value, total_cost, unrealized_gain, realized_gain, missing FROM daily_valuation "
+                  "WHERE date BETWEEN ? AND ?", ("2024-01-01", "2024-12-31")),
+    "replay": ("SELECT ticker, date, source, cost, quantity FROM transactions ORDER BY ticker, date, source", ()),
+    "table_versions": ("SELECT name, version FROM table_versions WHERE name IN (?, ?, ?)",
+                       ("database", "stock_data", "realized_gains")),
+}
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """
+    Apply the migrations newer than the database, each in its own transaction.
+
+    Returns:
+    - int: number of migrations applied
+    """
+    current = schema_version(conn)
+    applied = 0
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            # PRAGMA does not take parameters, version is an int from MIGRATIONS
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        if current:
+            print(f"Migrated database schema to version {version}: {description}")
+        applied += 1
+    return applied
+
+def bump_versions(conn, *tables):
+    """
+    Record that tables changed. Every writer calls it in the transaction that
+    changes them, caches built from a table compare table_versions instead of
+    scanning the table.
+    """
+    conn.executemany("""
+        INSERT INTO table_versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1
+    """, [(table,) for table in tables])
+
+def table_versions(conn, *tables):
+    """
+    Returns:
+    - list: the database's random id, then the version of each table (0 if never written)
+    """
+    names = ("database",) + tables
+    versions = dict(conn.execute(f"SELECT name, version FROM table_versions WHERE name IN ({','.join('?' * len(names))})",
+                                 names))
+    return [versions.get(name, 0) for name in names]
+
+def apply_pragmas(conn, pragmas=None):
+    """Per-connection tuning from SQLITE_PRAGMAS, journal_mode=WAL is also stored in the file."""
+    for name, value in (SQLITE_PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def connect(db_name="portfolio.db", **kwargs):
+    """Open db_name with the tuned pragmas and an up-to-date schema, kwargs go to sqlite3.connect."""
+    conn = sqlite3.connect(db_name, **kwargs)
+    apply_pragmas(conn)
+    migrate(conn)
+    return conn
+
+def query_plan(conn, query, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+def check_query_plans(conn):
+    """
+    Check that every hot query is answered from an index alone (or the primary key
+    of a WITHOUT ROWID table), without a table lookup, full scan or temporary sort.
+
+    Returns:
+    - dict: name: (ok, plan lines)
+    """
+    results = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        plan = query_plan(conn, query, params)
+        ok = all("COVERING INDEX" in line or "USING PRIMARY KEY" in line for line in plan if line.startswith(("SCAN", "SEARCH"))) \
+            and not any("TEMP B-TREE" in line for line in plan)
+        results[name] = (ok, plan)
+    return results
+
+def main():
+    conn = connect(sys.argv[1] if len(sys.argv) > 1 else "portfolio.db")
+    print(f"Schema version {schema_version(conn)}, journal mode {conn.execute('PRAGMA journal_mode').fetchone()[0]}")
+    failed = 0
+    for name, (ok, plan) in check_query_plans(conn).items():
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+        failed += not ok
+    conn.close()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import csv
+import os
+from bisect import bisect_right
+
+class SplitIndex:
+    """
+    Stock splits compiled per ticker into a sorted date array and cumulative ratio factors.
+
+    factors[ticker][i] is the product of the first i split ratios (after / before),
+    so the adjustment between any two dates is one division after two bisects.
+    """
+    _cache = {} # file_path: (mtime, SplitIndex)
+
+    def __init__(self, splits=None):
+        """
+        Parameters:
+        - splits (dict): {ticker: [(date, before_split, after_split), ...]}
+        """
+        self.dates = {}
+        self.factors = {}
+        for ticker, ticker_splits in (splits or {}).items():
+            dates, factors = [], [1.0]
+            for date, before_split, after_split in sorted(ticker_splits):
+                dates.append(date)
+                factors.append(factors[-1] * (after_split / before_split))
+            self.dates[ticker] = dates
+            self.factors[ticker] = factors
+
+    @classmethod
+    def from_csv(cls, file_path):
+        splits = {}
+        with open(file_path, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            for row in reader:
+                date, ticker, before_split, after_split = row
+                splits.setdefault(ticker, []).append((date, float(before_split), float(after_split)))
+        return cls(splits)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Load the index for reading, reusing the compiled index while the file is unchanged.
+        A missing file gives an empty index.
+        """
+        if not os.path.exists(file_path):
+            return cls()
+        mtime = os.path.getmtime(file_path)
+        cached = cls._cache.get(file_path)
+        if not cached or cached[0] != mtime:
+            cached = (mtime, cls.from_csv(file_path))
+            cls._cache[file_path] = cached
+        return cached[1]
+
+    def __contains__(self, ticker):
+        return ticker in self.dates
+
+    def __repr__(self):
+        return f"SplitIndex({ {ticker: list(zip(dates, self.factors[ticker][1:])) for ticker, dates in self.dates.items()} })"
+
+    def factor(self, ticker, old_date, new_date):
+        """
+        Cumulative split ratio for splits with old_date < split date <= new_date.
+        old_date 0 or None means from the beginning. With new_date before old_date
+        the ratio runs backward and is the inverse of factor(new_date, old_date).
+        """
+        dates = self.dates.get(ticker)
+        if not dates:
+            return 1.0
+        i = bisect_right(dates, old_date) if old_date else 0
+        j = bisect_right(dates, new_date) if new_date else 0
+        if j == i:
+            return 1.0
+        factors = self.factors[ticker]
+        return factors[j] / factors[i]
+
+    def adjust(self, ticker, old_date, new_date, quantity, cost_basis):
+        """
+        Carry a holding recorded on old_date forward to new_date.
+
+        Returns:
+        - (quantity, cost_basis)
+        """
+        ratio = self.factor(ticker, old_date, new_date)
+        if ratio == 1.0:
+            return quantity, cost_basis
+        return quantity * ratio, cost_basis / ratio
+
+    def normalize_quantity(self, ticker, date, quantity, as_of):
+        """Express a quantity held on date in shares as of the as_of date."""
+        return quantity * self.factor(ticker, date, as_of)
+
+    def normalize_price(self, ticker, date, price, as_of):
+        """Express a per-share price on date in shares as of the as_of date."""
+        return price / self.factor(ticker, date, as_of)
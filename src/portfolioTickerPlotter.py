@@ -1,17 +1,17 @@
-import sqlite3
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
-from portfolioDisplayer_util import PortfolioDisplayerUtil
+from portfolioDatabase import open_database
 
 class TickerRORPlotter:
     def __init__(self, db_name='portfolio.db'):
-        self.conn = sqlite3.connect(db_name)
+        # read-only, stock_data and daily_prices are never written here
+        self.db = open_database(db_name)
+        self.conn = self.db.acquire_reader()
 
     def get_all_tickers(self):
-        pf_util = PortfolioDisplayerUtil()
-        tickers = pf_util.get_all_tickers()
-        return tickers
+        query = "SELECT DISTINCT ticker FROM stock_data"
+        return [row[0] for row in self.conn.execute(query).fetchall()]
 
     def fetch_ticker_data(self, ticker):
         query = """
@@ -93,7 +93,8 @@ class TickerRORPlotter:
             self.plot_ror(ticker)
 
     def close(self):
-        self.conn.close()
+        self.db.release_reader(self.conn)
+        self.db.release()
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import numpy as np
+from const import *
+
+class ValidationReport:
+    """
+    Structured result of a validation pass.
+    Each issue is a dict with check, date, ticker, source and message.
+    """
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add(self, level, check, message, date=None, ticker=None, source=None):
+        date, ticker, source = (None if value is None else str(value) for value in (date, ticker, source))
+        issue = {"check": check, "date": date, "ticker": ticker, "source": source, "message": message}
+        (self.errors if level == "error" else self.warnings).append(issue)
+
+    def summary(self, limit=20):
+        lines = [f"{len(self.errors)} errors, {len(self.warnings)} warnings"]
+        for level, issues in (("ERROR", self.errors), ("WARNING", self.warnings)):
+            for issue in issues[:limit]:
+                lines.append(f"  {level} [{issue['check']}] {issue['message']}")
+            if len(issues) > limit:
+                lines.append(f"  ... {len(issues) - limit} more {level.lower()}s")
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.summary()
+
+
+class TransactionValidator:
+    """
+    Validate a batch of merged transactions with array operations before any write.
+
+    Checks:
+    - sign: a buy with a negative cost or a sell with a positive cost (error)
+    - zero_cost: cost 0, e.g. an airdrop or a transfer (VALIDATION_SEVERITY, warning by default)
+    - oversell: holding goes below zero after split adjustment (VALIDATION_SEVERITY, warning by default)
+    - duplicate: the same (date, ticker, source) comes from several files,
+      or is already in the transactions table and would be added to it (warning)
+    - unknown_ticker: ticker not in known_tickers (warning)
+    """
+    def __init__(self, split_index=None, known_tickers=None, tolerance=0.00001, severity=None):
+        self.split_index = split_index
+        self.known_tickers = known_tickers
+        self.tolerance = tolerance
+        self.severity = {**VALIDATION_SEVERITY, **(severity or {})}
+
+    def validate(self, rows, file_ids=None, history=(), history_keys=()):
+        """
+        Parameters:
+        - rows (list): (date, ticker, source, cost, quantity) tuples to be written
+        - file_ids (list): index of the file each row came from, for duplicate detection
+        - history (list): rows of the same tickers already stored and kept, only used for oversells
+        - history_keys (list): (date, ticker, source) keys the rows would be added to
+
+        Returns:
+        - ValidationReport
+        """
+        report = ValidationReport()
+        if not rows:
+            return report
+        dates, tickers, sources, costs, quantities = (np.array(column) for column in zip(*rows))
+        costs = costs.astype(np.float64)
+        quantities = quantities.astype(np.float64)
+
+        invalid = ((costs > 0) & (quantities < 0)) | ((costs < 0) & (quantities > 0))
+        for i in np.flatnonzero(invalid):
+            report.add("error", "sign", f"{dates[i]} {tickers[i]} ({sources[i]}): cost {costs[i]} "
+                                        f"and quantity {quantities[i]} is neither buy, sell, dividend nor fee",
+                       dates[i], tickers[i], sources[i])
+        for i in np.flatnonzero(costs == 0):
+            skip = ", the replay skips it" if quantities[i] > 0 else ""
+            report.add(self.severity["zero_cost"], "zero_cost", f"{dates[i]} {tickers[i]} ({sources[i]}): cost 0 "
+                                                                f"and quantity {quantities[i]}{skip}",
+                       dates[i], tickers[i], sources[i])
+
+        keys = np.char.add(np.char.add(np.char.add(np.char.add(dates, "|"), tickers), "|"), sources)
+        if file_ids is not None:
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            file_ids = np.asarray(file_ids, dtype=np.int64)
+            pairs = np.unique(inverse * (int(file_ids.max()) + 1) + file_ids)
+            files_per_key = np.bincount(pairs // (int(file_ids.max()) + 1), minlength=len(unique_keys))
+            # same-named files in different exchanges share a source, report once per source
+            duplicates = {}
+            for key in unique_keys[files_per_key > 1]:
+                date, ticker, source = key.split("|")
+                duplicates.setdefault(source, []).append(date)
+            for source, source_dates in sorted(duplicates.items()):
+                report.add("warning", "duplicate", f"{len(source_dates)} (date, ticker) keys of source {source} "
+                                                   f"appear in several files and will be merged, first on {min(source_dates)}",
+                           min(source_dates), source=source)
+        if len(history_keys):
+            stored = np.array(["|".join(key) for key in history_keys])
+            for i in np.flatnonzero(np.isin(keys, stored)):
+                report.add("warning", "duplicate", f"{dates[i]} {tickers[i]} ({sources[i]}) is already in "
+                                                   f"transactions and will be added to it",
+                           dates[i], tickers[i], sources[i])
+
+        if self.known_tickers is not None:
+            for ticker in np.unique(tickers[~np.isin(tickers, list(self.known_tickers))]):
+                report.add("warning", "unknown_ticker", f"{ticker} is not a known ticker", ticker=ticker)
+
+        # rows the replay skips do not move the holding
+        skipped = invalid | ((costs == 0) & (quantities > 0))
+        self.check_oversells(report, dates[~skipped], tickers[~skipped], quantities[~skipped], history)
+        return report
+
+    def check_oversells(self, report, dates, tickers, quantities, history=()):
+        if len(history):
+            history_dates, history_tickers, _, _, history_quantities = (np.array(column) for column in zip(*history))
+            dates = np.concatenate([dates, history_dates])
+            tickers = np.concatenate([tickers, history_tickers])
+            quantities = np.concatenate([quantities, history_quantities.astype(np.float64)])
+        if not len(dates):
+            return
+
+        # ticker, then date, buys before sells on the same day
+        order = np.lexsort((-quantities, dates, tickers))
+        dates, tickers, quantities = dates[order], tickers[order], quantities[order]
+
+        # express every quantity in shares after the last split
+        if self.split_index is not None:
+            factors = np.ones(len(quantities))
+            for ticker in np.unique(tickers):
+                if ticker not in self.split_index:
+                    continue
+                mask = tickers == ticker
+                split_dates = np.array(self.split_index.dates[ticker])
+                cumulative = np.array(self.split_index.factors[ticker])
+                factors[mask] = cumulative[-1] / cumulative[np.searchsorted(split_dates, dates[mask], side='right')]
+            quantities = quantities * factors
+
+        starts = np.r_[True, tickers[1:] != tickers[:-1]]
+        held = np.cumsum(quantities)
+        first = np.maximum.accumulate(np.where(starts, np.arange(len(held)), 0))
+        held = held - (held - quantities)[first]
+
+        oversold = held < -self.tolerance
+        reported = set()
+        for i in np.flatnonzero(oversold):
+            if tickers[i] in reported:
+                continue
+            reported.add(tickers[i])
+            report.add(self.severity["oversell"], "oversell", f"{dates[i]} {tickers[i]}: holding drops to {held[i]:.8f} "
+                                                              f"(split adjusted)", dates[i], tickers[i])
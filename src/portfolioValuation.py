@@ -0,0 +1,136 @@
+import numpy as np
+from datetime import date as date_cls, timedelta
+from portfolioPositions import get_position_store
+from priceCache import shift_date
+from priceService import get_price_service
+
+class DailyValuation:
+    """
+    Book totals per calendar day in the daily_valuation table: value and cost of the
+    held tickers that have a price, unrealized gain, cumulative realized gain and the
+    number of held tickers left out for a missing price.
+
+    The table only ever holds a prefix of the days up to the last settled one.
+    Writers that change an input delete the rows from the earliest affected date on
+    (replay_transactions for stock_data / realized_gains, PriceService for
+    daily_prices), and update() appends the days after the last stored row.
+    Unsettled days are valued on every call and never stored.
+    """
+    FIELDS = ("total_value", "total_cost", "unrealized_gain", "realized_gain", "missing")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def invalidate(self, date=None):
+        """Drop the rows from date on, all rows if date is None."""
+        with self.conn:
+            self.conn.execute("DELETE FROM daily_valuation WHERE date >= ?", (date or "",))
+
+    def last_date(self):
+        return self.conn.execute("SELECT MAX(date) FROM daily_valuation").fetchone()[0]
+
+    def settled_until(self, tickers):
+        """Last day whose closes are final for every ticker."""
+        service = get_price_service(self.conn)
+        return min((service.settled_until(ticker) for ticker in tickers), default=None)
+
+    def compute(self, dates):
+        """
+        Value the book on each date from the position store and PriceService.
+
+        Returns:
+        - dict: field: np.ndarray with one value per date
+        """
+        positions = get_position_store(self.conn)
+        quantity = positions.take("quantity", dates)
+        cost_basis = positions.take("cost_basis", dates)
+        realized_gain = positions.take("realized_gain", dates)
+        held = quantity != 0
+
+        # closes the stored series cannot answer are prefetched for every ticker in one batched call
+        service = get_price_service(self.conn)
+        prices = np.full(quantity.shape, np.nan)
+        pairs = []
+        for j, ticker in enumerate(positions.tickers):
+            rows = held[:, j].nonzero()[0]
+            prices[rows, j] = service.series_index.as_of_many(ticker, [dates[i] for i in rows])
+            pairs.extend((ticker, dates[i]) for i in rows[np.isnan(prices[rows, j])])
+        if pairs:
+            service.prefetch(pairs)
+            for j, ticker in enumerate(positions.tickers):
+                rows = held[:, j].nonzero()[0]
+                rows = rows[np.isnan(prices[rows, j])]
+                if len(rows):
+                    prices[rows, j] = service.get_many(ticker, [dates[i] for i in rows])
+
+        priced = held & ~np.isnan(prices)
+        total_value = np.where(priced, quantity * np.nan_to_num(prices), 0).sum(axis=1)
+        total_cost = np.where(priced, quantity * cost_basis, 0).sum(axis=1)
+        return {
+            "total_value": total_value,
+            "total_cost": total_cost,
+            "unrealized_gain": total_value - total_cost,
+            "realized_gain": realized_gain.sum(axis=1),
+            "missing": (held & ~priced).sum(axis=1),
+        }
+
+    def update(self):
+        """
+        Append rows for the settled days after the last stored one.
+
+        Returns:
+        - int: number of rows written
+        """
+        positions = get_position_store(self.conn)
+        end = self.settled_until(positions.tickers)
+        if not positions.days or end is None:
+            return 0
+        written = 0
+        while True:
+            last = self.last_date()
+            start = shift_date(last, 1) if last else positions.start
+            if start > end:
+                return written
+            first_day = date_cls.fromisoformat(start)
+            dates = [(first_day + timedelta(days=i)).isoformat()
+                     for i in range(date_cls.fromisoformat(end).toordinal() - first_day.toordinal() + 1)]
+            values = self.compute(dates)
+            if self.last_date() != last:
+                # closes stored by the prefetch invalidated earlier rows, value again from there
+                continue
+            rows = [(date, *(float(values[field][i]) for field in self.FIELDS[:-1]), int(values["missing"][i]))
+                    for i, date in enumerate(dates)]
+            with self.conn:
+                self.conn.executemany(f"""
+                    INSERT OR REPLACE INTO daily_valuation (date, {', '.join(self.FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)
+                """, rows)
+            print(f"Valued the portfolio on {len(rows)} days from {start} to {end}.")
+            written += len(rows)
+
+    def get_many(self, dates):
+        """
+        Book totals on each date, read from daily_valuation after update(). Dates after
+        the last stored row (today) are valued on the spot, dates before the first
+        holding are all zero.
+
+        Returns:
+        - dict: field: np.ndarray with one value per date
+        """
+        self.update()
+        dates = [date[:10] for date in dates]
+        values = {field: np.zeros(len(dates)) for field in self.FIELDS}
+        if not dates:
+            return values
+        stored = {row[0]: row[1:] for row in self.conn.execute(f"""
+            SELECT date, {', '.join(self.FIELDS)} FROM daily_valuation WHERE date BETWEEN ? AND ?
+        """, (min(dates), max(dates)))}
+        last = self.last_date() or ""
+        live = [i for i, date in enumerate(dates) if date not in stored and date > last]
+        for i, date in enumerate(dates):
+            for field, value in zip(self.FIELDS, stored.get(date, ())):
+                values[field][i] = value
+        if live:
+            computed = self.compute([dates[i] for i in live])
+            for field in self.FIELDS:
+                values[field][live] = computed[field]
+        return values
@@ -0,0 +1,260 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from marketCalendar import get_trading_calendar
+from const import *
+from const_private import *
+
+def shift_date(date, days):
+    return (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+def subtract_ranges(ranges, start, end):
+    """
+    Sub-ranges of [start, end] outside every (start, end) in ranges, all inclusive.
+    ranges must be sorted by start, they may overlap.
+    """
+    gaps = []
+    cursor = start
+    for range_start, range_end in ranges:
+        if range_end < cursor:
+            continue
+        if range_start > end:
+            break
+        if range_start > cursor:
+            gaps.append((cursor, shift_date(range_start, -1)))
+        cursor = shift_date(range_end, 1)
+        if cursor > end:
+            return gaps
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+class PriceCoverage:
+    """
+    Per-ticker index of date ranges whose daily closes are fully stored in daily_prices.
+
+    Ranges are inclusive [start, end] and kept merged, so a request only has to
+    fetch the sub-ranges that are not covered yet.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def ranges(self, ticker):
+        return self.conn.execute("SELECT start, end FROM price_coverage WHERE ticker = ? ORDER BY start",
+                                 (ticker,)).fetchall()
+
+    def is_covered(self, ticker, date):
+        return self.conn.execute("SELECT 1 FROM price_coverage WHERE ticker = ? AND start <= ? AND end >= ?",
+                                 (ticker, date, date)).fetchone() is not None
+
+    def missing(self, ticker, start, end):
+        """
+        Sub-ranges of [start, end] that are not covered.
+
+        Returns:
+        - list: (start, end) tuples, inclusive
+        """
+        return subtract_ranges(self.ranges(ticker), start, end)
+
+    def add(self, ticker, start, end):
+        """Mark [start, end] as covered, merging it with overlapping or adjacent ranges."""
+        self.add_many([(ticker, start, end)])
+
+    def add_many(self, ranges):
+        """add for several (ticker, start, end) ranges in one transaction."""
+        new_ranges = {}
+        for ticker, start, end in ranges:
+            new_ranges.setdefault(ticker, []).append((start, end))
+        rows = []
+        for ticker, ticker_ranges in new_ranges.items():
+            merged = []
+            for covered_start, covered_end in sorted(self.ranges(ticker) + ticker_ranges):
+                if merged and covered_start <= shift_date(merged[-1][1], 1):
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], covered_end))
+                else:
+                    merged.append((covered_start, covered_end))
+            rows.extend((ticker, covered_start, covered_end) for covered_start, covered_end in merged)
+        with self.conn:
+            self.conn.executemany("DELETE FROM price_coverage WHERE ticker = ?", [(ticker,) for ticker in new_ranges])
+            self.conn.executemany("INSERT INTO price_coverage (ticker, start, end) VALUES (?, ?, ?)", rows)
+
+    def discard(self, start=None, end=None):
+        """Remove [start, end] from every ticker's coverage, e.g. after deleting prices. None means unbounded."""
+        rows = self.conn.execute("SELECT ticker, start, end FROM price_coverage").fetchall()
+        kept = []
+        for ticker, covered_start, covered_end in rows:
+            if (end is not None and covered_start > end) or (start is not None and covered_end < start):
+                kept.append((ticker, covered_start, covered_end))
+                continue
+            if start is not None and covered_start < start:
+                kept.append((ticker, covered_start, shift_date(start, -1)))
+            if end is not None and covered_end > end:
+                kept.append((ticker, shift_date(end, 1), covered_end))
+        with self.conn:
+            self.conn.execute("DELETE FROM price_coverage")
+            self.conn.executemany("INSERT INTO price_coverage (ticker, start, end) VALUES (?, ?, ?)", kept)
+
+
+class PriceMisses:
+    """
+    Negative cache: (ticker, start, end) ranges the provider returned no data for
+    or failed on, e.g. delisted or unknown tickers. They are not requested again
+    until retry_after seconds have passed.
+    """
+    def __init__(self, conn, retry_after=PRICE_MISS_RETRY_AFTER):
+        self.conn = conn
+        self.retry_after = retry_after
+
+    def recent(self, ticker):
+        """Ranges of ticker that missed less than retry_after seconds ago, sorted by start."""
+        return self.conn.execute("""
+            SELECT start, end FROM price_misses WHERE ticker = ? AND checked_at > ? ORDER BY start
+        """, (ticker, time.time() - self.retry_after)).fetchall()
+
+    def retry_at(self, ticker, date):
+        """Unix time a miss covering date can be retried, None if there is none."""
+        row = self.conn.execute("""
+            SELECT MAX(checked_at) FROM price_misses WHERE ticker = ? AND start <= ? AND end >= ?
+        """, (ticker, date, date)).fetchone()
+        if row[0] is None or row[0] + self.retry_after <= time.time():
+            return None
+        return row[0] + self.retry_after
+
+    def add_many(self, ranges):
+        checked_at = time.time()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO price_misses (ticker, start, end, checked_at) VALUES (?, ?, ?, ?)",
+                                  [(ticker, start, end, checked_at) for ticker, start, end in ranges])
+
+    def clear(self, ticker=None):
+        with self.conn:
+            if ticker is None:
+                self.conn.execute("DELETE FROM price_misses")
+            else:
+                self.conn.execute("DELETE FROM price_misses WHERE ticker = ?", (ticker,))
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache with least recently used eviction and a time to live.
+
+    Used for unsettled prices: an entry older than ttl seconds is a miss, so
+    intraday quotes are fetched again, and at most maxsize entries are kept.
+    """
+    def __init__(self, maxsize=LIVE_PRICE_CACHE_SIZE, ttl=LIVE_PRICE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict() # key: (expires at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[0] <= self.clock():
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self.entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
+
+class PriceSeriesIndex:
+    """
+    In-memory as-of lookups over daily_prices.
+
+    Each ticker's stored closes and coverage ranges are loaded once into sorted
+    arrays, and "latest close on or before D" is answered with a binary search.
+    A close is only trusted for D when it is on D, when D is covered, or, for
+    exchange traded tickers, when no trading day lies between the close and D.
+    Otherwise the lookup misses and the caller falls back to fetching.
+    """
+    def __init__(self, conn, market="NYSE"):
+        self.conn = conn
+        self.market = market
+        self.series = {} # ticker: (dates, prices, coverage starts, coverage ends)
+
+    def load(self, ticker):
+        if ticker not in self.series:
+            rows = self.conn.execute("SELECT date, price FROM daily_prices WHERE ticker = ? ORDER BY date",
+                                     (ticker,)).fetchall()
+            ranges = PriceCoverage(self.conn).ranges(ticker)
+            self.series[ticker] = (np.array([date for date, _ in rows], dtype='U10'),
+                                   np.array([price for _, price in rows], dtype=np.float64),
+                                   np.array([start for start, _ in ranges], dtype='U10'),
+                                   np.array([end for _, end in ranges], dtype='U10'))
+        return self.series[ticker]
+
+    def invalidate(self, tickers=None):
+        """Drop cached series after daily_prices or price_coverage changed, all tickers by default."""
+        if tickers is None:
+            self.series.clear()
+        for ticker in tickers or ():
+            self.series.pop(ticker, None)
+
+    def as_of(self, ticker, date):
+        """
+        Returns:
+        - float: close to use on date, None if the stored closes cannot tell
+        """
+        price = self.as_of_many(ticker, [date])[0]
+        return None if np.isnan(price) else float(price)
+
+    def as_of_many(self, ticker, dates):
+        """
+        Vectorized as_of.
+
+        Returns:
+        - np.ndarray: float64 close per date, NaN where the stored closes cannot tell
+        """
+        close_dates, prices, covered_starts, covered_ends = self.load(ticker)
+        dates = np.asarray(dates, dtype='U10')
+        if not len(close_dates) or not len(dates):
+            return np.full(len(dates), np.nan)
+
+        i = np.searchsorted(close_dates, dates, side='right') - 1
+        found = i >= 0
+        last_dates = np.where(found, close_dates[np.maximum(i, 0)], "")
+        valid = found & (last_dates == dates)
+        if len(covered_starts):
+            j = np.searchsorted(covered_starts, dates, side='right') - 1
+            valid |= found & (j >= 0) & (covered_ends[np.maximum(j, 0)] >= dates)
+        if ticker not in CRYPTO_TICKERS and not valid.all():
+            # the shared calendar grows to cover both ends
+            get_trading_calendar(self.market, min(dates))
+            calendar = get_trading_calendar(self.market, max(dates))
+            previous_open = calendar.previous_open_many(dates)
+            valid |= found & (previous_open != "") & (last_dates >= previous_open)
+        return np.where(valid, prices[np.maximum(i, 0)], np.nan)
+
@@ -0,0 +1,90 @@
+import asyncio
+import random
+import threading
+import time
+from priceProvider import get_price_provider
+from const import *
+
+class TokenBucket:
+    """Allow rate acquisitions per second on average and up to capacity at once."""
+    def __init__(self, rate=FETCH_RATE_LIMIT, capacity=FETCH_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncPriceFetcher:
+    """
+    Run many provider downloads concurrently.
+
+    Providers are blocking, so every download runs in a worker thread. At most
+    concurrency downloads are in flight, starts are rate limited with a token
+    bucket and a download that raises is retried with exponential backoff.
+    Results are returned to the caller, which writes them back in one batch.
+    """
+    def __init__(self, provider=None, concurrency=FETCH_CONCURRENCY, rate=FETCH_RATE_LIMIT,
+                 burst=FETCH_BURST, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+        self.provider = provider or get_price_provider()
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+
+    async def download(self, semaphore, bucket, tickers, start_date, end_date):
+        for attempt in range(self.retries + 1):
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    return await asyncio.to_thread(self.provider.download, tickers, start_date, end_date)
+                except Exception as e:
+                    error = e
+                    if attempt == self.retries:
+                        print(f"Error fetching prices for {tickers} from {start_date} to {end_date}: {e}")
+                        return None
+            delay = self.backoff * 2 ** attempt
+            print(f"Fetching {tickers} failed ({error}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay * random.uniform(1, 1.25))
+
+    async def download_all(self, jobs):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate, self.burst)
+        return await asyncio.gather(*(self.download(semaphore, bucket, *job) for job in jobs))
+
+    def run(self, jobs):
+        """
+        Parameters:
+        - jobs (list): (tickers, start_date, end_date) tuples, end_date excluded
+
+        Returns:
+        - list: closes DataFrame per job, in the same order, None if the job failed
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.download_all(jobs))
+
+        # called from inside an event loop (e.g. a notebook), run in a separate thread
+        results = []
+        thread = threading.Thread(target=lambda: results.extend(asyncio.run(self.download_all(jobs))))
+        thread.start()
+        thread.join()
+        return results
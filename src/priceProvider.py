@@ -0,0 +1,200 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+import time
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from const import *
+
+class PriceProvider(ABC):
+    """
+    Source of daily closes. Analytics code only talks to this interface,
+    so the backend can be swapped without touching it. A backend implements
+    download, last_close and quotes are derived from it unless overridden.
+    """
+    name = "base"
+    batch_size = PREFETCH_BATCH_SIZE # tickers per download call
+
+    @abstractmethod
+    def download(self, tickers, start_date, end_date):
+        """
+        Daily closes in [start_date, end_date).
+
+        Parameters:
+        - tickers (list): ticker symbols
+        - start_date (str): "YYYY-MM-DD", included
+        - end_date (str): "YYYY-MM-DD", excluded
+
+        Returns:
+        - pd.DataFrame: indexed by date, one column per ticker that has data
+        """
+
+    def last_close(self, ticker, start_date, end_date):
+        """
+        Last close of ticker in [start_date, end_date).
+
+        Returns:
+        - (date, price): date as "YYYY-MM-DD", (None, None) if there is no data
+        """
+        closes = self.download([ticker], start_date, end_date)
+        if closes.empty or ticker not in closes.columns:
+            return None, None
+        series = closes[ticker].dropna()
+        if series.empty:
+            return None, None
+        return series.index[-1].strftime("%Y-%m-%d"), round(float(series.iloc[-1]), 8)
+
+    def quotes(self, tickers):
+        """
+        Latest price of every ticker with one call, the last daily close by default.
+
+        Returns:
+        - dict: ticker: price, tickers without data are left out
+        """
+        today = datetime.now(timezone.utc).date()
+        closes = self.download(tickers, (today - timedelta(days=7)).isoformat(), (today + timedelta(days=1)).isoformat())
+        quotes = {}
+        for ticker in tickers:
+            if ticker in closes.columns and not closes[ticker].dropna().empty:
+                quotes[ticker] = float(closes[ticker].dropna().iloc[-1])
+        return quotes
+
+
+class YFinanceProvider(PriceProvider):
+    """
+    Daily closes from Yahoo Finance.
+
+    By default every batch of PREFETCH_BATCH_SIZE tickers is one yf.download call,
+    and AsyncPriceFetcher runs the batches under its token bucket. yf.download keeps
+    its results in module level state that concurrent calls would mix up, so the
+    calls are serialized (each one already fetches its tickers in parallel).
+    per_ticker (YFINANCE_PER_TICKER) requests every ticker with Ticker.history
+    instead, which has no shared state and runs concurrently, at one round trip
+    per ticker.
+    """
+    name = "yfinance"
+    download_lock = threading.Lock() # yf.download is not safe to run concurrently
+
+    def __init__(self, per_ticker=YFINANCE_PER_TICKER):
+        self.per_ticker = per_ticker
+        self.batch_size = 1 if per_ticker else PREFETCH_BATCH_SIZE
+
+    def download(self, tickers, start_date, end_date):
+        import yfinance as yf
+
+        # [start_date, end_date), start_date is included, end_date is excluded
+        tickers = list(tickers)
+        if self.per_ticker:
+            # https://ranaroussi.github.io/yfinance/reference/api/yfinance.Ticker.history.html
+            columns = {}
+            for ticker in tickers:
+                history = yf.Ticker(ticker).history(start=start_date, end=end_date)
+                if not history.empty:
+                    columns[ticker] = history['Close'].tz_localize(None)
+            return pd.DataFrame(columns)
+
+        with self.download_lock:
+            history = yf.download(tickers, start=start_date, end=end_date, progress=False)
+        if history.empty:
+            return pd.DataFrame()
+        closes = history['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        if closes.index.tz is not None:
+            closes.index = closes.index.tz_localize(None)
+        # tickers without any close in the range are left out
+        return closes.dropna(axis=1, how='all')
+
+    def quotes(self, tickers):
+        import yfinance as yf
+
+        # one request for all tickers, 1 minute bars of the current day
+        tickers = list(tickers)
+        with self.download_lock:
+            history = yf.download(tickers, period="1d", interval="1m", progress=False)
+        if history.empty:
+            return {}
+        closes = history['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        return {ticker: float(closes[ticker].dropna().iloc[-1]) for ticker in tickers
+                if ticker in closes.columns and not closes[ticker].dropna().empty}
+
+
+class LocalPriceProvider(PriceProvider):
+    """
+    Offline provider reading price fixtures, with a fixed latency per call.
+
+    path is either a single CSV / Parquet file with date, ticker, close columns,
+    or a directory of <TICKER>.csv / <TICKER>.parquet files with date, close columns.
+    Parquet needs pyarrow (or fastparquet) installed.
+    """
+    name = "local"
+
+    def __init__(self, path=PRICE_FIXTURE_PATH, latency=PRICE_PROVIDER_LATENCY):
+        self.path = path
+        self.latency = latency
+        self.series = None # ticker: pd.Series of closes indexed by date
+
+    @staticmethod
+    def read_table(file_path):
+        if file_path.endswith(".parquet"):
+            df = pd.read_parquet(file_path)
+        else:
+            df = pd.read_csv(file_path)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def load(self):
+        series = {}
+        if os.path.isdir(self.path):
+            for file_name in sorted(os.listdir(self.path)):
+                ticker, ext = os.path.splitext(file_name)
+                if ext not in (".csv", ".parquet"):
+                    continue
+                df = self.read_table(os.path.join(self.path, file_name))
+                series[ticker] = df.set_index("date")["close"].sort_index()
+        elif os.path.exists(self.path):
+            df = self.read_table(self.path)
+            for ticker, group in df.groupby("ticker"):
+                series[ticker] = group.set_index("date")["close"].sort_index()
+        else:
+            print(f"Price fixtures {self.path} do not exist.")
+        self.series = series
+
+    def download(self, tickers, start_date, end_date):
+        if self.series is None:
+            self.load()
+        if self.latency:
+            time.sleep(self.latency)
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        columns = {}
+        for ticker in tickers:
+            if ticker in self.series:
+                series = self.series[ticker]
+                series = series[(series.index >= start) & (series.index < end)]
+                if not series.empty:
+                    columns[ticker] = series
+        return pd.DataFrame(columns)
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    LocalPriceProvider.name: LocalPriceProvider,
+}
+_providers = {}
+
+def get_price_provider(name=None):
+    """Shared provider instance, PRICE_PROVIDER in const.py by default."""
+    name = name or PRICE_PROVIDER
+    if name not in _providers:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown price provider: {name}")
+        _providers[name] = PROVIDERS[name]()
+    return _providers[name]
+
+def set_price_provider(provider):
+    """Make provider the shared default of get_price_provider(), e.g. an offline provider for a benchmark."""
+    global PRICE_PROVIDER
+    PRICE_PROVIDER = provider.name
+    _providers[provider.name] = provider
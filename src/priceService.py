@@ -0,0 +1,337 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pytz
+from priceProvider import get_price_provider
+from priceCache import PriceCoverage, PriceMisses, PriceSeriesIndex, TTLCache, shift_date, subtract_ranges
+from priceFetcher import AsyncPriceFetcher
+from portfolioDatabase import manager_of
+from portfolioSchema import bump_versions
+from const import *
+from const_private import *
+
+def today_est():
+    return datetime.now(pytz.timezone('US/Eastern')).strftime("%Y-%m-%d")
+
+def crypto_today():
+    """Current crypto day, day D runs until CRYPTO_EOD_CUTOFF_UTC on D + 1 (UTC)."""
+    return (datetime.now(timezone.utc) - timedelta(hours=CRYPTO_EOD_CUTOFF_UTC)).strftime("%Y-%m-%d")
+
+class PriceService:
+    """
+    The one code path for prices: live cache, then stored closes, then the provider.
+
+    - Settled dates (before today) are answered by as-of lookups over daily_prices.
+      A miss goes through prefetch, which downloads only ranges missing from
+      price_coverage and stores every close received in one write, so each close
+      is paid for once per database.
+    - Unsettled dates (the ticker's current day) are never stored, the quote is
+      kept in the live cache and fetched again after LIVE_PRICE_TTL. Crypto trades
+      around the clock: quotes of every crypto ticker are pulled in one batched
+      call and kept for CRYPTO_QUOTE_TTL, and a crypto day ends at
+      CRYPTO_EOD_CUTOFF_UTC on the next UTC day (crypto_today). current_day is the
+      one day boundary for both the live cache keys and settled_until.
+    - Ranges the provider has no data for are kept in price_misses and not
+      requested again for PRICE_MISS_RETRY_AFTER seconds, downloads that fail
+      are not retried by this instance. Prices that cannot be resolved are
+      None (NaN in arrays) and listed in missing with the reason.
+
+    Use get_price_service(conn) to share one instance per open database.
+    """
+    def __init__(self, conn, provider=None, market="NYSE"):
+        self.conn = conn
+        self.provider = provider
+        self.live = TTLCache()
+        self.coverage = PriceCoverage(conn)
+        self.series_index = PriceSeriesIndex(conn, market)
+        self.misses = PriceMisses(conn)
+        self.failed = {} # ticker: [(start, end)] downloads that raised in this process
+        self.missing = {} # (ticker, date): reason the price is missing
+
+    def get_provider(self):
+        return self.provider or get_price_provider()
+
+    def get(self, ticker, date):
+        """
+        Price of ticker on date, the last close on or before it for settled dates.
+
+        Returns:
+        - float: None if the provider has no data
+        """
+        if date > self.settled_until(ticker):
+            price = self.live.get((date, ticker))
+            if price is None:
+                price = self.fetch_live(ticker, date)
+        else:
+            price = self.series_index.as_of(ticker, date)
+            if price is None:
+                self.prefetch([(ticker, date)])
+                price = self.series_index.as_of(ticker, date)
+        if price is None:
+            self.mark_missing(ticker, date)
+        return price
+
+    @staticmethod
+    def current_day(ticker):
+        """Day of ticker still trading, its quotes are live and its close is not final."""
+        return crypto_today() if ticker in CRYPTO_TICKERS else today_est()
+
+    @staticmethod
+    def settled_until(ticker):
+        """Last date whose close of ticker is final."""
+        return shift_date(PriceService.current_day(ticker), -1)
+
+    def crypto_quotes(self, tickers=None):
+        """
+        Latest quote of every crypto ticker, refreshed in one batched call at most
+        every CRYPTO_QUOTE_TTL seconds. Meant for dashboards polling every minute.
+
+        Returns:
+        - dict: ticker: price, tickers without a quote are left out
+        """
+        today = crypto_today()
+        tickers = sorted(set(tickers or CRYPTO_TICKERS))
+        quotes = {ticker: self.live.get((today, ticker)) for ticker in tickers}
+        stale = [ticker for ticker, price in quotes.items()
+                 if price is None and subtract_ranges(self.skipped(ticker), today, today)]
+        if stale:
+            # refresh every crypto holding with the same call, it costs nothing extra
+            batch = sorted(set(stale) | set(CRYPTO_TICKERS))
+            try:
+                fetched = self.get_provider().quotes(batch)
+            except Exception as e:
+                print(f"Error fetching quotes for {batch}: {e}")
+                fetched = {}
+            for ticker, price in fetched.items():
+                self.live.set((today, ticker), round(float(price), 8), ttl=CRYPTO_QUOTE_TTL)
+                if ticker in quotes:
+                    quotes[ticker] = round(float(price), 8)
+        return {ticker: price for ticker, price in quotes.items() if price is not None}
+
+    def skipped(self, ticker):
+        """Ranges of ticker not to request now, sorted by start."""
+        return sorted(self.misses.recent(ticker) + self.failed.get(ticker, []))
+
+    def mark_missing(self, ticker, date):
+        if any(start <= date <= end for start, end in self.failed.get(ticker, [])):
+            # checked first, it needs no query
+            self.missing[(ticker, date)] = "download failed"
+            return
+        retry_at = self.misses.retry_at(ticker, date)
+        if retry_at is not None:
+            reason = f"no data, retry after {datetime.fromtimestamp(retry_at).strftime('%Y-%m-%d %H:%M')}"
+        else:
+            reason = "no data"
+        self.missing[(ticker, date)] = reason
+
+    def missing_summary(self, limit=10, dates=None):
+        """One line per ticker with missing prices (on dates only, if given), for warnings after a run."""
+        by_ticker = {}
+        for (ticker, date), reason in sorted(self.missing.items()):
+            if dates is not None and date not in dates:
+                continue
+            by_ticker.setdefault(ticker, []).append((date, reason))
+        lines = []
+        for ticker, misses in by_ticker.items():
+            dates = ", ".join(date for date, _ in misses[:limit]) + (" ..." if len(misses) > limit else "")
+            lines.append(f"{ticker}: {len(misses)} missing prices ({misses[-1][1]}): {dates}")
+        return "\n".join(lines)
+
+    def get_many(self, ticker, dates):
+        """
+        get for many dates of one ticker, settled dates are resolved in one vectorized lookup.
+
+        Returns:
+        - np.ndarray: float64 price per date, NaN where there is no data
+        """
+        prices = self.series_index.as_of_many(ticker, dates)
+        settled = self.settled_until(ticker)
+        # every unresolved settled date in one prefetch, so a long gap is one download, not one per date
+        unresolved = [i for i in np.flatnonzero(np.isnan(prices)) if dates[i] <= settled]
+        if unresolved:
+            self.prefetch([(ticker, dates[i]) for i in unresolved])
+            prices[unresolved] = self.series_index.as_of_many(ticker, [dates[i] for i in unresolved])
+        for i in np.flatnonzero(np.isnan(prices)):
+            if dates[i] <= settled:
+                self.mark_missing(ticker, dates[i])
+                continue
+            price = self.get(ticker, dates[i])
+            prices[i] = np.nan if price is None else price
+        return prices
+
+    def latest(self, ticker):
+        return self.get(ticker, self.current_day(ticker))
+
+    def fetch_live(self, ticker, date):
+        """Fetch the unsettled price of date, kept in the live cache only."""
+        if not subtract_ranges(self.skipped(ticker), date, date):
+            return None
+        if ticker in CRYPTO_TICKERS and date == crypto_today():
+            price = self.crypto_quotes([ticker]).get(ticker)
+            if price is not None:
+                return price
+        try:
+            print(f"Fetching price for {ticker} on {date}...")
+            # [date - 7, date + 1), the last close is the current quote
+            _, price = self.get_provider().last_close(ticker, shift_date(date, -7), shift_date(date, 1))
+        except Exception as e:
+            print(f"Error fetching price for {ticker} on {date}: {e}")
+            self.failed.setdefault(ticker, []).append((date, date))
+            return None
+        if price is None:
+            print(f"No price data found for {ticker} on {date}")
+            self.misses.add_many([(ticker, date, date)])
+            return None
+        self.live.set((date, ticker), price)
+        return price
+
+    def prefetch(self, pairs, batch_size=None):
+        """
+        Make sure every (ticker, date) pair can be answered without a network call.
+
+        For each ticker the window [first date - 7 days, last date] is checked against
+        the price_coverage index and only the uncovered sub-ranges are downloaded, with
+        batched multi-ticker calls run concurrently by AsyncPriceFetcher. Every daily
+        close received is stored in one write, not only the requested ones, so
+        overlapping windows (1W, 1M, 3M, YTD) cost no network call after the first run.
+
+        A requested past date without a close of its own (weekend, holiday) is
+        answered by the as-of lookup from the last close before it, nothing is stored
+        for it. The price of a ticker's current day goes to the live cache.
+
+        Parameters:
+        - pairs (iterable): (ticker, date) tuples, date in "YYYY-MM-DD"
+        - batch_size (int): tickers per download, the provider's batch_size by default
+
+        Returns:
+        - int: number of prices stored
+        """
+        provider = self.get_provider()
+        batch_size = batch_size or provider.batch_size
+        requested = {}
+        live = {} # ticker: its current day
+        for ticker, date in pairs:
+            if date <= self.settled_until(ticker):
+                requested.setdefault(ticker, set()).add(date)
+            elif date == self.current_day(ticker) and (date, ticker) not in self.live:
+                live[ticker] = date
+
+        if requested:
+            all_dates = [date for dates in requested.values() for date in dates]
+            placeholders = ','.join('?' * len(requested))
+            stored = self.conn.execute(f"""
+                SELECT ticker, date FROM daily_prices
+                WHERE ticker IN ({placeholders}) AND date BETWEEN ? AND ?
+            """, (*requested, min(all_dates), max(all_dates))).fetchall()
+            for ticker, date in stored:
+                requested[ticker].discard(date)
+            requested = {ticker: dates for ticker, dates in requested.items() if dates}
+        if not requested and not live:
+            return 0
+
+        # tickers sharing the same uncovered range are downloaded together
+        windows = {ticker: (shift_date(min(dates), -7), max(dates)) for ticker, dates in requested.items()}
+        gaps = {}
+        for ticker, (start_date, end_date) in windows.items():
+            skipped = self.skipped(ticker)
+            for gap_start, gap_end in self.coverage.missing(ticker, start_date, end_date):
+                for gap in subtract_ranges(skipped, gap_start, gap_end):
+                    gaps.setdefault(gap, []).append(ticker)
+        live = {ticker: day for ticker, day in sorted(live.items()) if subtract_ranges(self.skipped(ticker), day, day)}
+        # crypto quotes come from one batched quote call, the rest from daily bars
+        if any(ticker in CRYPTO_TICKERS for ticker in live):
+            self.crypto_quotes([ticker for ticker in live if ticker in CRYPTO_TICKERS])
+            live = {ticker: day for ticker, day in live.items() if (day, ticker) not in self.live}
+        live_days = {}
+        for ticker, day in live.items():
+            live_days.setdefault(day, []).append(ticker)
+
+        # [start_date, end_date + 1), end_date is included
+        jobs = []
+        for (start_date, end_date), gap_tickers in sorted(gaps.items()):
+            for i in range(0, len(gap_tickers), batch_size):
+                jobs.append((gap_tickers[i:i + batch_size], start_date, shift_date(end_date, 1)))
+        for day, day_tickers in sorted(live_days.items()):
+            for i in range(0, len(day_tickers), batch_size):
+                jobs.append((day_tickers[i:i + batch_size], shift_date(day, -7), shift_date(day, 1)))
+        if jobs:
+            print(f"Prefetching prices for {len(set(requested) | set(live))} tickers with {len(jobs)} downloads...")
+        results = AsyncPriceFetcher(provider).run(jobs)
+
+        rows, covered, misses = [], [], []
+        for (batch, start_date, end_date), closes in zip(jobs, results):
+            end_date = shift_date(end_date, -1)
+            if closes is None:
+                for ticker in batch:
+                    self.failed.setdefault(ticker, []).append((start_date, end_date))
+                continue
+            for ticker in batch:
+                series = closes[ticker].dropna() if ticker in closes.columns else pd.Series(dtype=float)
+                if live.get(ticker) == end_date:
+                    if series.empty:
+                        misses.append((ticker, end_date, end_date))
+                    else:
+                        self.live.set((end_date, ticker), round(float(series.iloc[-1]), 8))
+                    continue
+                if series.empty:
+                    # a few days without any close is a weekend or holiday, not missing data
+                    if (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days < 4:
+                        covered.append((ticker, start_date, end_date))
+                    else:
+                        misses.append((ticker, start_date, end_date))
+                    continue
+                settled = self.settled_until(ticker)
+                rows.extend((date.strftime("%Y-%m-%d"), ticker, round(float(price), 8)) for date, price in series.items()
+                            if date.strftime("%Y-%m-%d") <= settled)
+                covered.append((ticker, start_date, end_date))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)", rows)
+            if rows:
+                # book totals from the first new close on are stale
+                self.conn.execute("DELETE FROM daily_valuation WHERE date >= ?", (min(row[0] for row in rows),))
+                bump_versions(self.conn, "daily_prices")
+        self.coverage.add_many(covered)
+        self.misses.add_many(misses)
+        if misses:
+            print(f"No price data for {', '.join(sorted(set(ticker for ticker, _, _ in misses)))}, "
+                  f"not requested again for {self.misses.retry_after / 3600:g} hours")
+        self.series_index.invalidate(requested)
+        if DBUG:
+            print(f"Prefetched {len(rows)} closes in {len(jobs)} downloads, live prices {self.live.stats()}")
+        return len(rows)
+
+    def clear(self, date, before=False):
+        """Delete stored prices before date (or from date on) together with their coverage."""
+        with self.conn:
+            if before:
+                self.conn.execute("DELETE FROM daily_prices WHERE date < ?", (date,))
+            else:
+                self.conn.execute("DELETE FROM daily_prices WHERE date >= ?", (date,))
+            # as-of closes carry forward, so any later book total may have changed
+            self.conn.execute("DELETE FROM daily_valuation WHERE date >= ?", ("" if before else date,))
+            bump_versions(self.conn, "daily_prices")
+        if before:
+            self.coverage.discard(end=shift_date(date, -1))
+        else:
+            self.coverage.discard(start=date)
+        self.series_index.invalidate()
+
+    def stats(self):
+        return {"live": self.live.stats(), "series_loaded": len(self.series_index.series), "missing": len(self.missing)}
+
+
+_services = {} # connection opened outside open_database(): its own PriceService
+
+def get_price_service(conn):
+    """
+    Price service of conn's database. For a connection of a ConnectionManager (the
+    writer or a pooled reader) it is created once per manager and bound to the
+    writer, so it never writes through a read-only or closed connection. Any other
+    connection gets its own service, bound to that connection.
+    """
+    manager = manager_of(conn)
+    if manager is not None:
+        return manager.shared("prices", PriceService)
+    if conn not in _services:
+        _services[conn] = PriceService(conn)
+    return _services[conn]
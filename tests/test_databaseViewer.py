@@ -0,0 +1,44 @@
+import os
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def viewer(tmp_path, monkeypatch):
+    from databaseViewer import DatabaseViewer
+    from portfolioSchema import connect
+
+    monkeypatch.chdir(tmp_path)
+    conn = connect("portfolio.db")
+    with conn:
+        # a balance stored with a time of day must still export as a date
+        conn.executemany("INSERT INTO daily_cash (date, cash_balance) VALUES (?, ?)",
+                         [("2024-01-03", 50.5), ("2024-01-02 10:30:00", 100)])
+    conn.close()
+    viewer = DatabaseViewer()
+    yield viewer
+    viewer.close()
+
+@pytest.mark.parametrize("format, extension", [("parquet", "parquet"), ("arrow", "arrow")])
+def test_export_round_trip_is_typed(viewer, format, extension):
+    import datetime
+    import pyarrow.parquet as pq
+
+    filename = f"export/daily_cash.{extension}"
+    assert viewer.export_table("daily_cash", filename, format, chunk_rows=1) == 2
+    table = pq.read_table(filename) if format == "parquet" else pa.ipc.open_file(filename).read_all()
+    assert table.schema.field("date").type == pa.date32()
+    assert table.schema.field("cash_balance").type == pa.float64()
+    assert table.to_pylist() == [{"date": datetime.date(2024, 1, 2), "cash_balance": 100.0},
+                                 {"date": datetime.date(2024, 1, 3), "cash_balance": 50.5}]
+    assert not os.path.exists(f"{filename}.tmp")
+
+def test_failed_export_leaves_no_file(viewer):
+    from portfolioSchema import connect
+
+    conn = connect("portfolio.db")
+    with conn:
+        conn.execute("INSERT INTO daily_prices (date, ticker, price) VALUES ('2024-01-02', 'AAPL', 'n/a')")
+    conn.close()
+    assert viewer.export_table("daily_prices", "export/daily_prices.parquet") is None
+    assert os.listdir("export") == []
@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from marketCalendar import TradingCalendar
+
+@pytest.fixture
+def calendar():
+    # 2024 weekdays, 2024-01-01 and 2024-07-04 closed
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(366)]
+    closed = {"2024-01-01", "2024-07-04"}
+    is_open = np.array([day.weekday() < 5 and day.isoformat() not in closed for day in days])
+    return TradingCalendar("NYSE", 2024, 2024, is_open, overrides={"2025-01-09": False, "2023-12-30": True})
+
+def test_lookups_inside_the_range(calendar):
+    assert calendar.is_open("2024-01-02") and not calendar.is_open("2024-01-01")
+    assert calendar.previous_open("2024-07-04") == "2024-07-03"
+    assert calendar.next_open("2024-07-04 09:30:00") == "2024-07-05"
+
+def test_dates_before_the_range_fall_back_to_weekdays(calendar):
+    assert "2023-12-29" not in calendar
+    assert calendar.is_open("2023-12-29") and not calendar.is_open("2023-12-31")
+    # an override outside the range still applies
+    assert calendar.is_open("2023-12-30")
+    assert calendar.previous_open("2023-12-31") == "2023-12-30"
+    # 2024-01-01 is closed in the bitmap, the walk goes on before the range
+    assert calendar.previous_open("2024-01-01") == "2023-12-30"
+    assert calendar.next_open("2023-12-31") == "2024-01-02"
+
+def test_dates_after_the_range_use_the_overrides(calendar):
+    assert not calendar.is_open("2025-01-09")
+    assert calendar.is_open("2025-01-10")
+    assert calendar.next_open("2025-01-09") == "2025-01-10"
+    assert calendar.previous_open("2025-01-05") == "2025-01-03"
+
+def test_previous_open_many_agrees_with_previous_open(calendar):
+    dates = [(date(2024, 1, 1) + timedelta(days=i)).isoformat() for i in range(0, 366, 3)]
+    expected = [calendar.previous_open(day) if day >= "2024-01-02" else "" for day in dates]
+    assert calendar.previous_open_many(dates).tolist() == expected
+    # outside the range there is no answer from the bitmap
+    assert calendar.previous_open_many(["2023-06-01", "2025-06-01"]).tolist() == ["", ""]
+
+def test_build_applies_calendar_overrides():
+    pytest.importorskip("pandas_market_calendars")
+    from const import CALENDAR_OVERRIDES
+
+    calendar = TradingCalendar.build("NYSE", 2025, 2025)
+    for day, is_open in CALENDAR_OVERRIDES.items():
+        if day.startswith("2025"):
+            assert calendar.is_open(day) == is_open
+    assert calendar.is_open("2025-01-08") and not calendar.is_open("2025-01-11")
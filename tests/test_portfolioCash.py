@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from portfolioCash import CashLedger
+
+@pytest.fixture
+def ledger():
+    return CashLedger.from_balances([("2024-01-10", 100.0), ("2024-01-05", 50.0), ("2024-01-20", 80.0)])
+
+def test_get_before_between_and_after_rows(ledger):
+    assert ledger.get("2024-01-04") == 0
+    assert ledger.get("2024-01-05") == 50
+    # between rows the last balance on or before the date holds
+    assert ledger.get("2024-01-09") == 50
+    assert ledger.get("2024-01-15 16:00:00") == 100
+    assert ledger.get("2025-06-01") == 80
+
+def test_get_many_matches_get(ledger):
+    dates = ["2023-12-31", "2024-01-05", "2024-01-09", "2024-01-10", "2024-01-19", "2024-01-20", "2025-06-01"]
+    assert ledger.get_many(dates) == pytest.approx(np.array([ledger.get(date) for date in dates]))
+    assert CashLedger().get_many(dates) == pytest.approx(np.zeros(len(dates)))
+    assert CashLedger().get("2024-01-05") == 0
+
+def test_from_changes_is_a_prefix_sum():
+    ledger = CashLedger.from_changes([("2024-01-03", 100), ("2024-01-01", 50), ("2024-01-03", -30)])
+    assert ledger.get_many(["2023-12-31", "2024-01-01", "2024-01-02", "2024-01-03", "2024-02-01"]) == \
+        pytest.approx([0, 50, 50, 120, 120])
+    assert ledger.change_rows() == [("2024-01-01", 50.0), ("2024-01-03", 120.0)]
+
+def test_get_cash_queries_only_on_refresh(tmp_path, monkeypatch):
+    from portfolioDisplayer_util import PortfolioDisplayerUtil
+    from portfolioManager import PortfolioManager
+
+    monkeypatch.chdir(tmp_path)
+    db_name = str(tmp_path / "portfolio.db")
+    pm = PortfolioManager(db_name=db_name)
+    pdu = PortfolioDisplayerUtil(db_name)
+    statements = []
+    try:
+        pm.set_daily_cash("2024-01-05", 50)
+        pdu.refresh_cash_ledger()
+        pdu.conn.set_trace_callback(statements.append)
+        assert [pdu.get_cash(date) for date in ("2024-01-04", "2024-01-06")] == [0, 50]
+        assert statements == []
+        # a rewrite is picked up by the next refresh, not by the lookups before it
+        pm.set_daily_cash("2024-01-06", 70)
+        assert pdu.get_cash("2024-01-06") == 50
+        pdu.refresh_cash_ledger()
+        assert pdu.get_cash("2024-01-06") == 70
+    finally:
+        pdu.conn.set_trace_callback(None)
+        pdu.close()
+        pm.close()
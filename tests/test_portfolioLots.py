@@ -0,0 +1,53 @@
+import pytest
+from portfolioLots import LotEngine, LotQueue
+
+def test_fee_is_spread_over_open_lots_by_quantity():
+    queue = LotQueue()
+    queue.add("2024-01-02", 1, 100)
+    queue.add("2024-01-03", 3, 600)
+    assert queue.add_cost(8)
+    assert queue.cost == pytest.approx(708)
+    # a lot bought after the fee does not carry any of it
+    queue.add("2024-01-05", 2, 500)
+    relieved = queue.relieve(6, "fifo")
+    assert [cost for _, _, cost in relieved] == pytest.approx([102, 606, 500])
+    assert not len(queue)
+
+def test_fee_without_open_lots_is_not_charged():
+    assert not LotQueue().add_cost(5)
+
+def test_fee_survives_a_split():
+    queue = LotQueue()
+    queue.add("2024-01-02", 2, 200)
+    queue.add_cost(10)
+    queue.split(2)
+    relieved = queue.relieve(1, "lifo")
+    assert relieved[0][2] == pytest.approx(52.5)
+
+@pytest.mark.parametrize("method", LotEngine.METHODS)
+def test_lot_engine_adds_fees_to_cost_basis(method):
+    transactions = [
+        ("2024-01-02", "exchange", 100, 2),
+        ("2024-01-03", "exchange", 4, 0), # gas fee
+        ("2024-01-04", "exchange", -90, -1),
+    ]
+    stock_rows, gain_rows, _ = LotEngine(method).replay("ETH", transactions)
+    assert stock_rows[1][2] == pytest.approx(52)
+    assert stock_rows[2][2:] == pytest.approx((52, 1))
+    assert gain_rows == [("2024-01-04", "ETH", pytest.approx(38))]
+
+def test_average_replay_adds_fees_to_cost_basis(tmp_path, monkeypatch):
+    from portfolioManager import PortfolioManager
+
+    monkeypatch.chdir(tmp_path)
+    pm = PortfolioManager(db_name=str(tmp_path / "portfolio.db"), cost_basis_method="average")
+    try:
+        stock_rows, gain_rows = pm.replay_ticker("ETH", [
+            ("2024-01-02", "exchange", 100, 2),
+            ("2024-01-03", "exchange", 4, 0),
+            ("2024-01-04", "exchange", -90, -1),
+        ])
+    finally:
+        pm.close()
+    assert stock_rows[1][2:] == pytest.approx((52, 2))
+    assert gain_rows == [("2024-01-04", "ETH", pytest.approx(38))]
@@ -0,0 +1,53 @@
+import os
+import pytest
+from const import TRANSACTIONS_PATH
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    from portfolioManager import PortfolioManager
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(f"{TRANSACTIONS_PATH}exchange")
+    write("exchange/broker.csv", ["2024-01-02,AAPL,100,1", "2024-01-03,MSFT,200,1"])
+    pm = PortfolioManager(db_name=str(tmp_path / "portfolio.db"), replay=True)
+    pm.sync_transactions([f"{TRANSACTIONS_PATH}exchange/"], f"{TRANSACTIONS_PATH}cash/cash.csv")
+    # every replay after the first sync, as (tickers, start_date)
+    pm.replays = []
+    replay = pm.replay_transactions
+    def recording_replay(tickers=None, start_date=None):
+        pm.replays.append((tickers, start_date))
+        return replay(tickers=tickers, start_date=start_date)
+    monkeypatch.setattr(pm, "replay_transactions", recording_replay)
+    yield pm
+    pm.close()
+
+def write(name, lines):
+    with open(f"{TRANSACTIONS_PATH}{name}", "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def sync(pm):
+    pm.sync_transactions([f"{TRANSACTIONS_PATH}exchange/"], f"{TRANSACTIONS_PATH}cash/cash.csv")
+
+def test_unchanged_files_are_skipped(manager):
+    sync(manager)
+    assert manager.replays == []
+
+def test_changed_file_replays_its_tickers_from_the_earliest_change(manager):
+    write("exchange/broker.csv", ["2024-01-02,AAPL,100,1", "2024-01-03,MSFT,200,1",
+                                  "2024-02-05,MSFT,210,1", "2024-03-01,MSFT,-220,-1"])
+    sync(manager)
+    assert manager.replays == [(["MSFT"], "2024-02-05")]
+    assert manager.conn.execute("SELECT total_quantity FROM stock_data WHERE ticker = 'MSFT' "
+                                "ORDER BY date DESC LIMIT 1").fetchone()[0] == pytest.approx(1)
+
+def test_split_file_change_replays_everything(manager):
+    write("stock_split.csv", ["2024-01-10,AAPL,1,2"])
+    sync(manager)
+    assert manager.replays == [(None, None)]
+    sync(manager)
+    assert manager.replays == [(None, None)]
+
+def test_malformed_row_exits_with_the_file_name(manager):
+    write("exchange/broker.csv", ["2024-01-02,AAPL,100,1", "2024-01,MSFT,200,1"])
+    with pytest.raises(SystemExit, match="broker.csv"):
+        sync(manager)
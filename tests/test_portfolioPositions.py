@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import pytest
+from const import TRANSACTIONS_PATH
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    from portfolioSchema import bump_versions, connect
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(TRANSACTIONS_PATH)
+    # 1 -> 2 split of AAPL on 2024-01-05
+    with open(f"{TRANSACTIONS_PATH}stock_split.csv", "w") as f:
+        f.write("2024-01-05,AAPL,1,2\n")
+    conn = connect(str(tmp_path / "portfolio.db"))
+    with conn:
+        conn.executemany("INSERT INTO stock_data (date, ticker, cost_basis, total_quantity) VALUES (?, ?, ?, ?)",
+                         [("2024-01-02", "AAPL", 100, 10), ("2024-01-10", "AAPL", 60, 15), ("2024-01-03", "MSFT", 300, 1)])
+        conn.executemany("INSERT INTO realized_gains (date, ticker, gain) VALUES (?, ?, ?)",
+                         [("2024-01-03", "AAPL", 5), ("2024-01-09", "AAPL", 7)])
+        # no AAPL close from 2024-01-04 to 2024-01-07, none for MSFT at all
+        conn.executemany("INSERT INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
+                         [("2023-12-29", "AAPL", 99), ("2024-01-03", "AAPL", 101), ("2024-01-08", "AAPL", 51)])
+        bump_versions(conn, "stock_data", "realized_gains", "daily_prices")
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def store(conn):
+    from portfolioPositions import PositionStore
+    return PositionStore.open(conn).refresh()
+
+def test_take_carries_rows_through_the_split(store):
+    dates = ["2024-01-01", "2024-01-02", "2024-01-04", "2024-01-05", "2024-01-09", "2024-01-10"]
+    assert store.take("quantity", dates, ["AAPL"])[:, 0] == pytest.approx([0, 10, 10, 20, 20, 15])
+    assert store.take("cost_basis", dates, ["AAPL"])[:, 0] == pytest.approx([0, 100, 100, 50, 50, 60])
+    assert store.take("realized_gain", dates, ["AAPL"])[:, 0] == pytest.approx([0, 0, 5, 5, 12, 12])
+    assert store.take("quantity", ["2024-01-05"], ["MSFT", "NONE"])[0] == pytest.approx([1, 0])
+
+def test_close_is_forward_filled_across_a_gap(store):
+    closes = store.take("close", ["2024-01-01", "2024-01-02", "2024-01-06", "2024-01-08"], ["AAPL", "MSFT"])
+    # the close before the first row carries into it, MSFT never has one
+    assert closes[:, 0] == pytest.approx([np.nan, 99, 101, 51], nan_ok=True)
+    assert np.isnan(closes[:, 1]).all()
+
+def test_at_and_window_agree_with_take(store):
+    assert store.at("2024-01-01") is None
+    row = store.at("2024-01-06")
+    i = store.ticker_ids["AAPL"]
+    assert (row["quantity"][i], row["cost_basis"][i], row["close"][i]) == pytest.approx((20, 50, 101))
+    dates, window = store.window("2024-01-04", "2024-01-06")
+    assert list(dates) == ["2024-01-04", "2024-01-05", "2024-01-06"]
+    assert window["quantity"] == pytest.approx(store.take("quantity", list(dates)))
+
+def test_refresh_rebuilds_only_after_bump_versions(conn, store, monkeypatch):
+    from portfolioSchema import bump_versions
+
+    builds = []
+    for part in ("build_positions", "build_close"):
+        build = getattr(store, part)
+        monkeypatch.setattr(store, part, lambda *args, part=part, build=build: (builds.append(part), build(*args)))
+    store.refresh()
+    assert builds == []
+
+    with conn:
+        conn.execute("INSERT INTO daily_prices (date, ticker, price) VALUES ('2024-01-09', 'AAPL', 52)")
+    store.refresh()
+    assert builds == []
+    with conn:
+        bump_versions(conn, "daily_prices")
+    store.refresh()
+    assert builds == ["build_close"]
+    assert store.take("close", ["2024-01-09"], ["AAPL"])[0, 0] == pytest.approx(52)
+
+    with conn:
+        conn.execute("UPDATE stock_data SET total_quantity = 16 WHERE date = '2024-01-10' AND ticker = 'AAPL'")
+        bump_versions(conn, "stock_data")
+    store.refresh()
+    # close is keyed on the positions it was built for, so it follows them
+    assert builds == ["build_close", "build_positions", "build_close"]
+    assert store.take("quantity", ["2024-01-10"], ["AAPL"])[0, 0] == pytest.approx(16)
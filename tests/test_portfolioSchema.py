@@ -0,0 +1,42 @@
+import sqlite3
+import pytest
+from portfolioSchema import HOT_QUERIES, MIGRATIONS, SCHEMA_VERSION, check_query_plans, migrate, query_plan, schema_version
+
+def full_scans(plan):
+    # "SCAN t USING COVERING INDEX i" reads the index alone, a bare "SCAN t" reads the whole table
+    return [line for line in plan if line.startswith("SCAN") and "COVERING INDEX" not in line]
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "portfolio.db")
+    migrate(conn)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def upgraded(tmp_path):
+    # a database created at version 1 and upgraded in place on the next open
+    conn = sqlite3.connect(tmp_path / "old.db")
+    version, _, statements = MIGRATIONS[0]
+    for statement in statements:
+        conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    assert migrate(conn) == len(MIGRATIONS) - 1
+    yield conn
+    conn.close()
+
+def test_migrations_reach_schema_version(conn):
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert migrate(conn) == 0
+
+@pytest.mark.parametrize("db", ["conn", "upgraded"])
+def test_hot_queries_use_indexes(db, request):
+    results = check_query_plans(request.getfixturevalue(db))
+    assert set(results) == set(HOT_QUERIES)
+    for name, (ok, plan) in results.items():
+        assert not full_scans(plan), f"{name} scans a table: {plan}"
+        assert ok, f"{name} is not answered from an index alone: {plan}"
+
+def test_full_scan_is_detected(conn):
+    assert full_scans(query_plan(conn, "SELECT * FROM transactions WHERE cost > ?", (0,)))
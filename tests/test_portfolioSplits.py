@@ -0,0 +1,27 @@
+import pytest
+from portfolioSplits import SplitIndex
+
+@pytest.fixture
+def splits():
+    # 2-for-1 on 2024-06-10, then 3-for-1 on 2024-09-02
+    return SplitIndex({"NVDA": [("2024-06-10", 1, 2), ("2024-09-02", 1, 3)]})
+
+def test_factor_forward(splits):
+    assert splits.factor("NVDA", "2024-01-02", "2024-06-09") == 1.0
+    assert splits.factor("NVDA", "2024-01-02", "2024-06-10") == 2.0
+    assert splits.factor("NVDA", "2024-01-02", "2024-12-31") == 6.0
+    assert splits.factor("NVDA", None, "2024-12-31") == 6.0
+    assert splits.factor("MSFT", "2024-01-02", "2024-12-31") == 1.0
+
+def test_factor_backward_is_inverse(splits):
+    assert splits.factor("NVDA", "2024-12-31", "2024-07-01") == pytest.approx(1 / 3)
+    assert splits.factor("NVDA", "2024-12-31", "2024-01-02") == pytest.approx(1 / 6)
+    assert splits.factor("NVDA", "2024-07-01", "2024-06-10") == 1.0
+
+def test_normalize_before_split(splits):
+    # 60 shares held after both splits are 10 shares as of a date before the first one
+    assert splits.normalize_quantity("NVDA", "2024-10-01", 60, "2024-05-01") == pytest.approx(10)
+    assert splits.normalize_price("NVDA", "2024-10-01", 100, "2024-05-01") == pytest.approx(600)
+    # and back again
+    assert splits.normalize_quantity("NVDA", "2024-05-01", 10, "2024-10-01") == pytest.approx(60)
+    assert splits.normalize_price("NVDA", "2024-05-01", 600, "2024-10-01") == pytest.approx(100)
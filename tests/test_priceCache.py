@@ -0,0 +1,147 @@
+import pytest
+from priceCache import PriceCoverage, subtract_ranges
+
+@pytest.fixture
+def conn(tmp_path):
+    from portfolioSchema import connect
+
+    conn = connect(str(tmp_path / "portfolio.db"))
+    yield conn
+    conn.close()
+
+def test_subtract_ranges():
+    ranges = [("2024-01-05", "2024-01-10"), ("2024-01-08", "2024-01-12"), ("2024-01-20", "2024-01-25")]
+    assert subtract_ranges(ranges, "2024-01-01", "2024-01-31") == [
+        ("2024-01-01", "2024-01-04"), ("2024-01-13", "2024-01-19"), ("2024-01-26", "2024-01-31")]
+    assert subtract_ranges(ranges, "2024-01-06", "2024-01-12") == []
+    assert subtract_ranges(ranges, "2024-01-11", "2024-01-21") == [("2024-01-13", "2024-01-19")]
+    assert subtract_ranges([], "2024-01-01", "2024-01-02") == [("2024-01-01", "2024-01-02")]
+
+def test_coverage_merges_adjacent_ranges_and_reports_gaps(conn):
+    coverage = PriceCoverage(conn)
+    coverage.add_many([("AAPL", "2024-01-01", "2024-01-10"), ("AAPL", "2024-01-11", "2024-01-15"),
+                       ("AAPL", "2024-02-01", "2024-02-10"), ("MSFT", "2024-01-05", "2024-01-06")])
+    assert coverage.ranges("AAPL") == [("2024-01-01", "2024-01-15"), ("2024-02-01", "2024-02-10")]
+    assert coverage.missing("AAPL", "2023-12-25", "2024-02-05") == [("2023-12-25", "2023-12-31"), ("2024-01-16", "2024-01-31")]
+    assert coverage.is_covered("AAPL", "2024-01-12") and not coverage.is_covered("AAPL", "2024-01-20")
+    # overlapping ranges merge too
+    coverage.add("AAPL", "2024-01-14", "2024-02-03")
+    assert coverage.ranges("AAPL") == [("2024-01-01", "2024-02-10")]
+    assert coverage.missing("MSFT", "2024-01-01", "2024-01-10") == [("2024-01-01", "2024-01-04"), ("2024-01-07", "2024-01-10")]
+
+def test_coverage_discard_splits_ranges(conn):
+    coverage = PriceCoverage(conn)
+    coverage.add_many([("AAPL", "2024-01-01", "2024-01-31"), ("MSFT", "2024-03-01", "2024-03-31")])
+    coverage.discard(start="2024-01-10", end="2024-01-20")
+    assert coverage.ranges("AAPL") == [("2024-01-01", "2024-01-09"), ("2024-01-21", "2024-01-31")]
+    assert coverage.ranges("MSFT") == [("2024-03-01", "2024-03-31")]
+    coverage.discard(start="2024-01-05")
+    assert coverage.ranges("AAPL") == [("2024-01-01", "2024-01-04")]
+    assert coverage.ranges("MSFT") == []
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """Weekday calendar of 2024 with 2024-01-15 closed, instead of the exchange's."""
+    import numpy as np
+    import priceCache
+    from datetime import date
+    from marketCalendar import TradingCalendar
+
+    days = [date.fromordinal(date(2024, 1, 1).toordinal() + i) for i in range(366)]
+    is_open = np.array([day.weekday() < 5 and day.isoformat() != "2024-01-15" for day in days])
+    calendar = TradingCalendar("NYSE", 2024, 2024, is_open)
+    monkeypatch.setattr(priceCache, "get_trading_calendar", lambda market, date=None: calendar)
+    return calendar
+
+def test_as_of_trusts_a_close_until_the_next_trading_day(conn, calendar):
+    import numpy as np
+    from priceCache import PriceSeriesIndex
+
+    with conn:
+        conn.executemany("INSERT INTO daily_prices (date, ticker, price) VALUES (?, ?, ?)",
+                         [("2024-01-05", "AAPL", 5), ("2024-01-12", "AAPL", 12), ("2024-02-01", "AAPL", 32)])
+    PriceCoverage(conn).add("AAPL", "2024-01-20", "2024-01-31")
+    index = PriceSeriesIndex(conn)
+    dates = ["2024-01-04", "2024-01-05", "2024-01-07", "2024-01-08", "2024-01-15", "2024-01-16", "2024-01-25", "2024-02-01"]
+    # before the first close: nothing, the weekend after a close and a holiday: the close,
+    # a trading day without its close: unknown unless it is covered
+    expected = [np.nan, 5, 5, np.nan, 12, np.nan, 12, 32]
+    assert index.as_of_many("AAPL", dates) == pytest.approx(expected, nan_ok=True)
+    assert [index.as_of("AAPL", date) for date in dates] == [None if np.isnan(price) else price for price in expected]
+    assert np.isnan(index.as_of_many("MSFT", dates)).all()
+
+def test_as_of_is_stale_after_invalidate_only(conn, calendar):
+    from priceCache import PriceSeriesIndex
+
+    index = PriceSeriesIndex(conn)
+    with conn:
+        conn.execute("INSERT INTO daily_prices (date, ticker, price) VALUES ('2024-01-05', 'AAPL', 5)")
+    assert index.as_of("AAPL", "2024-01-05") == 5
+    with conn:
+        conn.execute("INSERT INTO daily_prices (date, ticker, price) VALUES ('2024-01-08', 'AAPL', 8)")
+    assert index.as_of("AAPL", "2024-01-08") is None
+    index.invalidate(["AAPL"])
+    assert index.as_of("AAPL", "2024-01-08") == 8
+
+def test_crypto_close_is_only_trusted_on_its_day_or_when_covered(conn, calendar, monkeypatch):
+    import priceCache
+    from priceCache import PriceSeriesIndex
+
+    monkeypatch.setattr(priceCache, "CRYPTO_TICKERS", ["BTC-USD"])
+    with conn:
+        conn.execute("INSERT INTO daily_prices (date, ticker, price) VALUES ('2024-01-05', 'BTC-USD', 42000)")
+    index = PriceSeriesIndex(conn)
+    # crypto trades on weekends, Friday's close says nothing about Saturday
+    assert index.as_of("BTC-USD", "2024-01-05") == 42000
+    assert index.as_of("BTC-USD", "2024-01-06") is None
+    PriceCoverage(conn).add("BTC-USD", "2024-01-05", "2024-01-06")
+    index.invalidate()
+    assert index.as_of("BTC-USD", "2024-01-06") == 42000
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_ttl_cache_evicts_the_least_recently_used():
+    from priceCache import TTLCache
+
+    cache = TTLCache(maxsize=2, ttl=60, clock=Clock())
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # "b" was used least recently
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_cache_expires_entries():
+    from priceCache import TTLCache
+
+    clock = Clock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("quote", 1.5)
+    cache.set("crypto", 2.5, ttl=10)
+    clock.now += 30
+    assert cache.get("quote") == 1.5
+    assert "crypto" not in cache and cache.get("crypto", "missing") == "missing"
+    clock.now += 30
+    assert cache.get("quote") is None
+    assert cache.stats() == {"size": 0, "hits": 1, "misses": 2, "evictions": 0, "expirations": 2, "hit_rate": 0.3333}
+
+def test_price_misses_expire(conn, monkeypatch):
+    import priceCache
+    from priceCache import PriceMisses
+
+    now = [1000.0]
+    monkeypatch.setattr(priceCache.time, "time", lambda: now[0])
+    misses = PriceMisses(conn, retry_after=3600)
+    misses.add_many([("DELISTED", "2024-01-01", "2024-01-31")])
+    assert misses.recent("DELISTED") == [("2024-01-01", "2024-01-31")]
+    assert misses.retry_at("DELISTED", "2024-01-15") == 4600
+    assert misses.retry_at("DELISTED", "2024-02-01") is None
+    now[0] += 3600
+    assert misses.recent("DELISTED") == []
+    assert misses.retry_at("DELISTED", "2024-01-15") is None
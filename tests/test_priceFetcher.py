@@ -0,0 +1,103 @@
+import asyncio
+import sys
+import threading
+import time
+import types
+import numpy as np
+import pandas as pd
+import pytest
+from priceFetcher import AsyncPriceFetcher, TokenBucket
+from priceProvider import PriceProvider, YFinanceProvider
+
+class FlakyProvider(PriceProvider):
+    """Raises on the first failures calls, then returns one close per ticker."""
+    name = "flaky"
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def download(self, tickers, start_date, end_date):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("timed out")
+        return pd.DataFrame({ticker: [1.0] for ticker in tickers}, index=pd.to_datetime([start_date]))
+
+def test_token_bucket_limits_the_rate():
+    async def acquire_all(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    # 2 tokens at once, then one every 0.05s
+    asyncio.run(acquire_all(TokenBucket(rate=20, capacity=2), 5))
+    assert time.monotonic() - start >= 0.14
+
+def test_failed_download_is_retried_with_backoff():
+    provider = FlakyProvider(failures=2)
+    results = AsyncPriceFetcher(provider, retries=3, backoff=0.01, rate=0).run([(["AAPL"], "2024-01-02", "2024-01-03")])
+    assert provider.calls == 3
+    assert list(results[0].columns) == ["AAPL"]
+
+def test_download_gives_up_after_the_last_retry():
+    provider = FlakyProvider(failures=10)
+    assert AsyncPriceFetcher(provider, retries=2, backoff=0.001, rate=0).run([(["AAPL"], "2024-01-02", "2024-01-03")]) == [None]
+    assert provider.calls == 3
+
+def test_results_keep_the_job_order():
+    jobs = [([f"T{i}"], f"2024-01-{i + 1:02d}", f"2024-01-{i + 2:02d}") for i in range(6)]
+    results = AsyncPriceFetcher(FlakyProvider(failures=0), concurrency=3, rate=0).run(jobs)
+    assert [list(closes.columns) for closes in results] == [tickers for tickers, _, _ in jobs]
+
+@pytest.fixture
+def yfinance(monkeypatch):
+    """Fake yfinance module recording yf.download calls and how many overlap."""
+    module = types.SimpleNamespace(calls=[], running=0, overlap=0)
+    lock = threading.Lock()
+
+    def download(tickers, start=None, end=None, progress=True, **kwargs):
+        with lock:
+            module.running += 1
+            module.overlap = max(module.overlap, module.running)
+        module.calls.append(list(tickers))
+        time.sleep(0.01)
+        days = pd.date_range(start, end, inclusive="left", tz="America/New_York")
+        columns = pd.MultiIndex.from_product([["Close", "Open"], tickers])
+        history = pd.DataFrame(1.0, index=days, columns=columns)
+        # a ticker without data comes back as an all-NaN column
+        history[("Close", "NONE")] = np.nan
+        with lock:
+            module.running -= 1
+        return history
+
+    def ticker(symbol):
+        def history(start=None, end=None):
+            module.calls.append([symbol])
+            days = pd.date_range(start, end, inclusive="left", tz="America/New_York")
+            return pd.DataFrame({"Close": 2.0}, index=days)
+        return types.SimpleNamespace(history=history)
+
+    module.download = download
+    module.Ticker = ticker
+    monkeypatch.setitem(sys.modules, "yfinance", module)
+    return module
+
+def test_yfinance_downloads_each_batch_in_one_call(yfinance):
+    provider = YFinanceProvider(per_ticker=False)
+    closes = provider.download(["AAPL", "MSFT", "NONE"], "2024-01-02", "2024-01-04")
+    assert yfinance.calls == [["AAPL", "MSFT", "NONE"]]
+    assert list(closes.columns) == ["AAPL", "MSFT"]
+    assert closes.index.tz is None and len(closes) == 2
+
+def test_yfinance_batches_never_overlap(yfinance):
+    jobs = [([f"T{i}", f"U{i}"], "2024-01-02", "2024-01-04") for i in range(4)]
+    results = AsyncPriceFetcher(YFinanceProvider(per_ticker=False), concurrency=4, rate=0).run(jobs)
+    assert len(yfinance.calls) == 4 and yfinance.overlap == 1
+    assert all(list(closes.columns) == tickers for closes, (tickers, _, _) in zip(results, jobs))
+
+def test_yfinance_per_ticker_option(yfinance):
+    provider = YFinanceProvider(per_ticker=True)
+    assert provider.batch_size == 1
+    closes = provider.download(["AAPL", "MSFT"], "2024-01-02", "2024-01-04")
+    assert yfinance.calls == [["AAPL"], ["MSFT"]]
+    assert closes["MSFT"].tolist() == [2.0, 2.0]
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+from priceProvider import LocalPriceProvider, PriceProvider, get_price_provider
+
+CLOSES = {"AAPL": [("2024-01-02", 185.6), ("2024-01-03", 184.3), ("2024-01-05", 181.2)],
+          "MSFT": [("2024-01-02", 370.9), ("2024-01-04", 367.9)]}
+
+def long_table():
+    return pd.DataFrame([(date, ticker, close) for ticker, rows in CLOSES.items() for date, close in rows],
+                        columns=["date", "ticker", "close"])
+
+def check(provider):
+    closes = provider.download(["AAPL", "MSFT", "NONE"], "2024-01-03", "2024-01-05")
+    # end_date is excluded, tickers without data have no column
+    assert list(closes.columns) == ["AAPL", "MSFT"]
+    assert closes["AAPL"].dropna().to_dict() == {pd.Timestamp("2024-01-03"): 184.3}
+    assert closes["MSFT"].dropna().to_dict() == {pd.Timestamp("2024-01-04"): 367.9}
+    assert provider.last_close("AAPL", "2024-01-01", "2024-01-10") == ("2024-01-05", 181.2)
+    assert provider.last_close("MSFT", "2024-01-05", "2024-01-10") == (None, None)
+
+def test_csv_directory(tmp_path):
+    for ticker, rows in CLOSES.items():
+        pd.DataFrame(rows, columns=["date", "close"]).to_csv(tmp_path / f"{ticker}.csv", index=False)
+    check(LocalPriceProvider(str(tmp_path)))
+
+def test_single_csv_file(tmp_path):
+    long_table().to_csv(tmp_path / "closes.csv", index=False)
+    check(LocalPriceProvider(str(tmp_path / "closes.csv")))
+
+def test_parquet_directory(tmp_path):
+    pytest.importorskip("pyarrow")
+    for ticker, rows in CLOSES.items():
+        pd.DataFrame(rows, columns=["date", "close"]).to_parquet(tmp_path / f"{ticker}.parquet")
+    check(LocalPriceProvider(str(tmp_path)))
+
+def test_missing_fixtures_have_no_data(tmp_path):
+    assert LocalPriceProvider(str(tmp_path / "none")).download(["AAPL"], "2024-01-01", "2024-02-01").empty
+
+def test_incomplete_provider_fails_on_instantiation():
+    class NoDownload(PriceProvider):
+        name = "incomplete"
+    with pytest.raises(TypeError):
+        NoDownload()
+
+def test_unknown_provider_name():
+    with pytest.raises(ValueError):
+        get_price_provider("nope")
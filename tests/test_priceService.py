@@ -0,0 +1,120 @@
+import pandas as pd
+import pytest
+from priceProvider import PriceProvider
+
+class StubProvider(PriceProvider):
+    """Weekday closes of every ticker in closes, records each download."""
+    name = "stub"
+
+    def __init__(self, tickers=("AAPL", "MSFT")):
+        self.tickers = set(tickers)
+        self.calls = []
+
+    def download(self, tickers, start_date, end_date):
+        self.calls.append((sorted(tickers), start_date, end_date))
+        days = pd.bdate_range(start_date, pd.Timestamp(end_date) - pd.Timedelta(days=1))
+        return pd.DataFrame({ticker: [float(day.day) for day in days] for ticker in tickers if ticker in self.tickers},
+                            index=days)
+
+@pytest.fixture
+def conn(tmp_path):
+    from portfolioSchema import connect
+
+    conn = connect(str(tmp_path / "portfolio.db"))
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def service(conn):
+    from priceService import PriceService
+    return PriceService(conn, provider=StubProvider())
+
+def stored(conn, ticker):
+    return conn.execute("SELECT date, price FROM daily_prices WHERE ticker = ? ORDER BY date", (ticker,)).fetchall()
+
+def test_prefetch_batches_tickers_and_stores_only_received_closes(conn, service):
+    # Friday and the Sunday after it, tickers with the same window share one download
+    pairs = [(ticker, date) for ticker in ("AAPL", "MSFT") for date in ("2024-01-05", "2024-01-07")]
+    assert service.prefetch(pairs) == 12
+    assert service.provider.calls == [(["AAPL", "MSFT"], "2023-12-29", "2024-01-08")]
+    # every close received is stored, the weekend gets no fill rows
+    assert stored(conn, "AAPL") == [("2023-12-29", 29.0), ("2024-01-01", 1.0), ("2024-01-02", 2.0),
+                                    ("2024-01-03", 3.0), ("2024-01-04", 4.0), ("2024-01-05", 5.0)]
+    # as_of answers the weekend from Friday's close
+    assert service.get("AAPL", "2024-01-07") == 5.0
+    assert service.get("MSFT", "2024-01-06") == 5.0
+    assert len(service.provider.calls) == 1
+
+def test_prefetch_skips_stored_dates(service):
+    service.prefetch([("AAPL", "2024-01-05")])
+    assert service.prefetch([("AAPL", "2024-01-05"), ("AAPL", "2024-01-03")]) == 0
+    assert len(service.provider.calls) == 1
+
+def test_prefetch_downloads_only_uncovered_gaps(service):
+    service.prefetch([("AAPL", "2024-01-05")])
+    # the window 2024-01-05 .. 2024-01-12 overlaps the covered 2023-12-29 .. 2024-01-05
+    service.prefetch([("AAPL", "2024-01-12")])
+    assert service.provider.calls[1] == (["AAPL"], "2024-01-06", "2024-01-13")
+    assert service.coverage.ranges("AAPL") == [("2023-12-29", "2024-01-12")]
+
+def test_missed_range_is_not_requested_until_it_expires(conn):
+    from priceService import PriceService
+
+    service = PriceService(conn, provider=StubProvider(tickers=()))
+    assert service.get("DELISTED", "2024-01-10") is None
+    assert len(service.provider.calls) == 1
+    assert service.missing[("DELISTED", "2024-01-10")].startswith("no data, retry after")
+    # the whole window 2024-01-03 .. 2024-01-10 missed, nothing is requested
+    assert service.get("DELISTED", "2024-01-10") is None
+    assert len(service.provider.calls) == 1
+    # a window reaching past the miss requests only the rest
+    service.get("DELISTED", "2024-01-09")
+    assert service.provider.calls[-1] == (["DELISTED"], "2024-01-02", "2024-01-03")
+    service.misses.clear("DELISTED")
+    service.get("DELISTED", "2024-01-10")
+    assert service.provider.calls[-1] == (["DELISTED"], "2024-01-03", "2024-01-11")
+
+@pytest.fixture
+def crypto_evening(monkeypatch):
+    """21:00 EST on 2025-01-01 is 02:00 UTC on 2025-01-02, with the cutoff at 00:00 UTC."""
+    import priceService
+
+    monkeypatch.setattr(priceService, "CRYPTO_TICKERS", ["BTC-USD"])
+    monkeypatch.setattr(priceService, "today_est", lambda: "2025-01-01")
+    monkeypatch.setattr(priceService, "crypto_today", lambda: "2025-01-02")
+
+def test_crypto_today_applies_the_cutoff(monkeypatch):
+    from datetime import datetime, timezone
+    import priceService
+
+    class Now(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2025, 1, 2, 1, 30, tzinfo=timezone.utc)
+
+    monkeypatch.setattr(priceService, "datetime", Now)
+    monkeypatch.setattr(priceService, "CRYPTO_EOD_CUTOFF_UTC", 0)
+    assert priceService.crypto_today() == "2025-01-02"
+    # with the cutoff at 02:00 UTC, day 2025-01-01 is still trading
+    monkeypatch.setattr(priceService, "CRYPTO_EOD_CUTOFF_UTC", 2)
+    assert priceService.crypto_today() == "2025-01-01"
+
+def test_crypto_uses_one_day_boundary(conn, crypto_evening):
+    from priceService import PriceService
+
+    class QuoteProvider(StubProvider):
+        def quotes(self, tickers):
+            self.calls.append(("quotes", sorted(tickers)))
+            return {ticker: 99000.0 for ticker in tickers}
+
+    service = PriceService(conn, provider=QuoteProvider(tickers=("BTC-USD", "AAPL")))
+    assert service.settled_until("BTC-USD") == "2025-01-01"
+    assert service.settled_until("AAPL") == "2024-12-31"
+    # the live quote is keyed by the crypto day, 2025-01-01 is settled and gets its stored close
+    assert service.latest("BTC-USD") == 99000.0
+    assert service.get("BTC-USD", "2025-01-01") == 1.0
+    assert service.provider.calls[0] == ("quotes", ["BTC-USD"])
+    # the unsettled stock day is never stored
+    service.latest("AAPL")
+    assert conn.execute("SELECT MAX(date) FROM daily_prices WHERE ticker = 'AAPL'").fetchone()[0] is None
+    assert conn.execute("SELECT MAX(date) FROM daily_prices WHERE ticker = 'BTC-USD'").fetchone()[0] == "2025-01-01"